@@ -96,7 +96,9 @@ class EdgeSAM(Model):
         # Cache for image embedding
         self.cache_size = 10
         self.preloaded_size = self.cache_size - 3
-        self.image_embedding_cache = PersistentCache()
+        self.image_embedding_cache = PersistentCache(
+            half_precision=self.config.get("cache_half_precision", False)
+        )
 
         # Pre-inference worker
         self.pre_inference_thread = None
@@ -265,6 +267,7 @@ class EdgeSAM(Model):
         self.stop_inference = True
         if self.pre_inference_thread:
             self.pre_inference_thread.quit()
+        self.image_embedding_cache.close()
 
     def preload_worker(self, files):
         """
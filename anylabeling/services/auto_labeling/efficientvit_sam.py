@@ -271,7 +271,9 @@ class EfficientViT_SAM(Model):
         # Cache for image embedding
         self.cache_size = 10
         self.preloaded_size = self.cache_size - 3
-        self.image_embedding_cache = PersistentCache()
+        self.image_embedding_cache = PersistentCache(
+            half_precision=self.config.get("cache_half_precision", False)
+        )
 
         # Pre-inference worker
         self.pre_inference_thread = None
@@ -449,6 +451,7 @@ class EfficientViT_SAM(Model):
         self.stop_inference = True
         if self.pre_inference_thread:
             self.pre_inference_thread.quit()
+        self.image_embedding_cache.close()
 
     def preload_worker(self, files):
         """
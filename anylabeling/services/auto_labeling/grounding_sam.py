@@ -316,7 +316,9 @@ class GroundingSAM(Model):
         # Cache for image embedding
         self.cache_size = 10
         self.preloaded_size = self.cache_size - 3
-        self.image_embedding_cache = PersistentCache()
+        self.image_embedding_cache = PersistentCache(
+            half_precision=self.config.get("cache_half_precision", False)
+        )
         self.current_image_embedding_cache = {}
 
         # Pre-inference worker
@@ -843,6 +845,7 @@ class GroundingSAM(Model):
         self.stop_inference = True
         if self.pre_inference_thread:
             self.pre_inference_thread.quit
+        self.image_embedding_cache.close()
 
     def preload_worker(self, files):
         """
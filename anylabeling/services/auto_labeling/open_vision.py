@@ -153,7 +153,9 @@ class OpenVision(Model):
         # Cache for image embedding
         self.cache_size = 1
         self.preloaded_size = 1
-        self.image_embedding_cache = PersistentCache()
+        self.image_embedding_cache = PersistentCache(
+            half_precision=self.config.get("cache_half_precision", False)
+        )
 
         # Pre-inference worker
         self.pre_inference_thread = None
@@ -466,6 +468,7 @@ class OpenVision(Model):
         self.stop_inference = True
         if self.pre_inference_thread:
             self.pre_inference_thread.quit
+        self.image_embedding_cache.close()
 
     def preload_worker(self, files):
         """
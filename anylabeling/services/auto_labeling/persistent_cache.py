@@ -1,191 +1,750 @@
 """Thread-safe persistent cache implementation for image embeddings."""
 
+import io
 import os
+import mmap
+import functools
 import pickle
+import time
+import struct
 import hashlib
 import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tempfile
-import shutil
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cache file layout: header, then buffer sizes, pickle payload and raw
+# buffers, the latter three zstd-compressed when _FLAG_ZSTD is set. Each
+# raw buffer starts at a multiple of _ALIGNMENT so that uncompressed files
+# can be memory-mapped and the arrays used in place.
+_MAGIC = b"XALC"
+_FORMAT_VERSION = 2
+_FLAG_ZSTD = 0x01
+_HEADER = struct.Struct("<4sBB2xIQ")
+_ALIGNMENT = 64
+# Buffer size for cache file IO, large enough to coalesce the small
+# writes pickle emits for headers and opcodes
+_IO_BUFFER_SIZE = 1 << 20
+# Windows can not replace or delete a file while it is memory-mapped, and
+# cached arrays keep their mapping alive, so files are read there instead
+_USE_MMAP = os.name != "nt"
+
+_now = time.time
+
+
+def get_default_cache_dir():
+    """Return the cache directory used when none is given.
+
+    XANYLABELING_CACHE_DIR takes precedence. Otherwise the cache lives in
+    the user cache directory ($XDG_CACHE_HOME or ~/.cache, %LOCALAPPDATA%
+    on Windows) rather than /tmp, which is often a size-limited tmpfs.
+    """
+    cache_dir = os.environ.get("XANYLABELING_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    if os.name == "nt":
+        base_dir = os.environ.get("LOCALAPPDATA") or tempfile.gettempdir()
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+    return os.path.join(base_dir, "xanylabeling_cache")
+
+
+def _padding(pos):
+    """Number of bytes needed to align pos to _ALIGNMENT."""
+    return -pos % _ALIGNMENT
+
+
+def _read_exact(f, nbytes):
+    """Read exactly nbytes from f into a new bytearray."""
+    buffer = bytearray(nbytes)
+    view = memoryview(buffer)
+    pos = 0
+    while pos < nbytes:
+        count = f.readinto(view[pos:])
+        if not count:
+            raise EOFError("Truncated cache file")
+        pos += count
+    return buffer
+
+
+def _write_body(out, payload, raws):
+    """Write buffer sizes, pickle payload and aligned raw buffers to out."""
+    sizes = struct.pack(f"<{len(raws)}Q", *(raw.nbytes for raw in raws))
+    out.write(sizes)
+    out.write(payload)
+    pos = _HEADER.size + len(sizes) + len(payload)
+    for raw in raws:
+        padding = _padding(pos)
+        out.write(bytes(padding))
+        out.write(raw)
+        pos += padding + raw.nbytes
+
+
+def _serialize(value):
+    """Pickle value, returning the payload and its out-of-band buffers."""
+    buffers = []
+    payload = pickle.dumps(
+        value, protocol=5, buffer_callback=buffers.append
+    )
+    return payload, [buffer.raw() for buffer in buffers]
+
+
+def _restore_dtype(array, dtype):
+    """Cast an array stored at reduced precision back to its dtype."""
+    return array.astype(dtype)
+
+
+class _HalfArray:
+    """Pickles a float32 array as float16, loading it back as float32."""
+
+    __slots__ = ("array",)
+
+    def __init__(self, array):
+        self.array = array
+
+    def __reduce__(self):
+        return _restore_dtype, (
+            self.array.astype(np.float16),
+            self.array.dtype.str,
+        )
+
+
+_FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+
+def _fits_half(array):
+    """Whether a float32 array can be cast to float16 without overflow."""
+    if array.size == 0:
+        return True
+    return bool(max(array.max(), -array.min()) <= _FLOAT16_MAX)
+
+
+def _to_half(value):
+    """Wrap the float32 arrays in value to be stored as float16.
+
+    Arrays with values outside the float16 range are kept as float32
+    instead of overflowing to inf.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype == np.float32 and _fits_half(value):
+            return _HalfArray(value)
+        return value
+    if isinstance(value, dict):
+        return {key: _to_half(item) for key, item in value.items()}
+    if type(value) in (list, tuple):
+        return type(value)(_to_half(item) for item in value)
+    return value
+
+
+def _content_id(payload, raws):
+    """Hash serialized data to identify identical values."""
+    digest = hashlib.blake2b(payload, digest_size=16)
+    for raw in raws:
+        digest.update(raw)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=4096)
+def _cache_file_name(key):
+    """Name the cache file of a key from a hash of it."""
+    # Use hash of the full path to create a unique filename
+    key_hash = hashlib.blake2b(
+        key.encode("utf-8", "surrogatepass"), digest_size=16
+    ).hexdigest()
+    return f"embedding_{key_hash}.pkl"
+
+
+def _dump(payload, raws, f, compression_level=None):
+    """Write a serialized value into f.
+
+    The body is zstd-compressed when compression_level is given.
+    """
+    flags = 0 if compression_level is None else _FLAG_ZSTD
+    f.write(
+        _HEADER.pack(_MAGIC, _FORMAT_VERSION, flags, len(raws), len(payload))
+    )
+    if compression_level is None:
+        _write_body(f, payload, raws)
+        return
+    compressor = zstandard.ZstdCompressor(
+        level=compression_level, threads=-1
+    )
+    with compressor.stream_writer(f, closefd=False) as out:
+        _write_body(out, payload, raws)
+
+
+def _load(f):
+    """Load a value written by _dump from an unbuffered binary file.
+
+    Uncompressed files are memory-mapped copy-on-write (read into memory on
+    Windows), so the returned arrays share pages with the OS page cache
+    until they are modified.
+    """
+    magic, version, flags, count, size = _HEADER.unpack(
+        _read_exact(f, _HEADER.size)
+    )
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+        raise ValueError("Unsupported cache file format")
+
+    if not flags & _FLAG_ZSTD:
+        if _USE_MMAP:
+            view = memoryview(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            )
+        else:
+            f.seek(0)
+            view = memoryview(_read_exact(f, os.fstat(f.fileno()).st_size))
+        pos = _HEADER.size + 8 * count
+        sizes = struct.unpack_from(f"<{count}Q", view, _HEADER.size)
+        payload = view[pos : pos + size]
+        pos += size
+        buffers = []
+        for nbytes in sizes:
+            pos += _padding(pos)
+            buffers.append(view[pos : pos + nbytes])
+            pos += nbytes
+        if pos > len(view):
+            raise EOFError("Truncated cache file")
+        return pickle.loads(payload, buffers=buffers)
+
+    if zstandard is None:
+        raise ValueError("zstandard is required to read this cache file")
+    # The buffered reader also closes f, which the caller closes anyway
+    with io.BufferedReader(f, _IO_BUFFER_SIZE) as buffered:
+        f = zstandard.ZstdDecompressor().stream_reader(buffered, closefd=False)
+        sizes = struct.unpack(f"<{count}Q", _read_exact(f, 8 * count))
+        payload = _read_exact(f, size)
+        pos = _HEADER.size + 8 * count + size
+        buffers = []
+        for nbytes in sizes:
+            padding = _padding(pos)
+            _read_exact(f, padding)
+            buffers.append(_read_exact(f, nbytes))
+            pos += padding + nbytes
+    return pickle.loads(payload, buffers=buffers)
 
 
 class PersistentCache:
     """Thread-safe persistent cache implementation for image embeddings."""
 
-    def __init__(self, cache_dir=None, max_size_gb=50.0):
+    # Journal size (in lines) below which it is never compacted
+    JOURNAL_COMPACT_MIN_LINES = 4096
+
+    # Number of independent locks guarding cache files
+    LOCK_SHARDS = 32
+
+    EVICTION_POLICIES = ("lru", "mru", "fifo")
+
+    # Threads used to stat files missing from the journal at startup
+    STARTUP_STAT_WORKERS = 16
+
+    def __init__(
+        self,
+        cache_dir=None,
+        max_size_gb=50.0,
+        compression_level=3,
+        memory_items=16,
+        eviction="lru",
+        durable=True,
+        half_precision=False,
+    ):
         """
         Initialize persistent cache.
         
         Args:
-            cache_dir: Directory to store cache files. If None, uses temp directory.
+            cache_dir: Directory to store cache files. If None, uses
+                get_default_cache_dir().
             max_size_gb: Maximum cache size in GB before cleanup.
+            compression_level: zstd level used to compress cache files, or
+                None to store them uncompressed. Ignored when the optional
+                zstandard package is not installed.
+            memory_items: Number of recently used values kept decoded in
+                memory in front of the disk cache. Values are shared between
+                callers and must not be modified in place.
+            eviction: Which files to remove first once the size limit is
+                exceeded: "lru" (least recently used), "mru" (most recently
+                used, suits repeated linear scans over a dataset larger than
+                the cache) or "fifo" (oldest written).
+            durable: Write each file to a temporary name and rename it into
+                place, so a crash never leaves a partial file behind. With
+                False files are written in place; a partial file left by a
+                crash fails to load and is dropped like any corrupt entry.
+            half_precision: Store float32 arrays as float16, halving the
+                size of cached embeddings. They are cast back to float32
+                on load, which costs a copy instead of a memory map.
         """
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError(
+                f"Unknown eviction policy {eviction!r}, "
+                f"expected one of {self.EVICTION_POLICIES}"
+            )
         if cache_dir is None:
-            cache_dir = os.path.join(tempfile.gettempdir(), "xanylabeling_cache")
+            cache_dir = get_default_cache_dir()
         
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Cache file paths are built as plain strings on the hot path
+        self._cache_dir_str = str(self.cache_dir) + os.sep
         self.max_size_bytes = int(max_size_gb * 1024 * 1024 * 1024)
-        self.lock = threading.Lock()
+        self.eviction = eviction
+        self.durable = durable
+        self.half_precision = half_precision
+        self.compression_level = (
+            compression_level if zstandard is not None else None
+        )
+        # File IO is serialized per shard so lookups of different keys
+        # can run concurrently; metadata and the journal have their own lock
+        self._shards = [threading.Lock() for _ in range(self.LOCK_SHARDS)]
+        self._meta_lock = threading.Lock()
         
-        # Create metadata file to track access times
-        self.metadata_file = self.cache_dir / "metadata.pkl"
+        # In-memory index {name: (size, access_time)} of the cache files,
+        # ordered from least to most recently used (written, for "fifo")
+        # and persisted as an append-only journal of "name\tsize\tts" lines
+        self.metadata_file = self.cache_dir / "metadata.log"
+        self._journal_lines = 0
         self.metadata = self._load_metadata()
+        self._total_size = sum(size for size, _ in self.metadata.values())
+        # Decoded values of the hottest entries, guarded by _meta_lock
+        self.memory_items = memory_items
+        self._mem = OrderedDict()
+        # Content id of the values written by this instance and the file
+        # holding each, so identical values are hard-linked, not rewritten
+        self._content = {}
+        self._content_of = {}
+        # File each name was written to or linked from this instance and
+        # {file: [names, size]}, so a file shared by several names counts
+        # toward the total size once
+        self._file_of = {}
+        self._file_refs = {}
+        self._closed = False
+        self._open_journal()
+
+    def _open_journal(self):
+        """Open the journal for appending.
+
+        The file is closed, flushing buffered records, when the cache is
+        closed or garbage collected, or at interpreter exit. The finalizer
+        only references the file so it does not keep the cache alive.
+        """
+        self._journal = open(self.metadata_file, 'ab', buffering=1 << 16)
+        self._journal_finalizer = weakref.finalize(self, self._journal.close)
+
+    def close(self):
+        """Flush and close the journal and drop the values held in memory.
+
+        Call this once the cache is no longer used, e.g. when its model is
+        unloaded.
+        """
+        with self._meta_lock:
+            self._closed = True
+            self._mem.clear()
+            self._content.clear()
+            self._content_of.clear()
+            self._journal_finalizer()
 
     def _load_metadata(self):
-        """Load metadata from disk."""
+        """Build the index from the directory, using journaled entries."""
+        journal = {}
         try:
-            if self.metadata_file.exists():
-                with open(self.metadata_file, 'rb') as f:
-                    return pickle.load(f)
+            with open(self.metadata_file, 'rb') as f:
+                for line in f:
+                    self._journal_lines += 1
+                    try:
+                        fields = line.rstrip(b'\n').decode().split('\t')
+                        if len(fields) == 2 and fields[1] == '-':
+                            journal.pop(fields[0], None)
+                        elif len(fields) == 3:
+                            journal[fields[0]] = (
+                                int(fields[1]),
+                                float(fields[2]),
+                            )
+                    except ValueError:
+                        # Skip a malformed line, e.g. one cut short by a
+                        # crash, without losing the records after it
+                        continue
+        except OSError:
+            pass
+
+        # The directory is the ground truth; the journal may be stale if
+        # another instance wrote to the same cache directory
+        entries = []
+        unknown = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    name = entry.name
+                    if not (
+                        name.startswith("embedding_") and name.endswith(".pkl")
+                    ):
+                        continue
+                    if name in journal:
+                        entries.append((name, journal[name]))
+                    else:
+                        unknown.append(entry.path)
+        except Exception:
+            pass
+
+        # Files missing from the journal (e.g. it was lost) need a stat each;
+        # overlap them since they are bound by filesystem latency
+        if unknown:
+            with ThreadPoolExecutor(
+                max_workers=min(self.STARTUP_STAT_WORKERS, len(unknown))
+            ) as executor:
+                for path, stat in zip(
+                    unknown, executor.map(self._stat_or_none, unknown)
+                ):
+                    if stat is not None:
+                        entries.append((
+                            os.path.basename(path),
+                            (stat.st_size, stat.st_mtime),
+                        ))
+
+        entries.sort(key=lambda item: item[1][1])
+        return OrderedDict(entries)
+
+    @staticmethod
+    def _stat_or_none(path):
+        """Stat a file, returning None if it has disappeared."""
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _append_journal(self, name, entry=None):
+        """Append an index entry, or a removal record when entry is None."""
+        try:
+            if entry is None:
+                line = f"{name}\t-\n"
+            else:
+                line = f"{name}\t{entry[0]}\t{entry[1]!r}\n"
+            self._journal.write(line.encode())
+            self._journal_lines += 1
         except Exception:
             pass
-        return {}
 
-    def _save_metadata(self):
-        """Save metadata to disk."""
+    def _compact_metadata(self):
+        """Rewrite the journal with one line per live entry."""
+        temp_path = self.metadata_file.with_suffix('.tmp')
         try:
-            with open(self.metadata_file, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            self._journal_finalizer()
+            with open(temp_path, 'wb', buffering=1 << 16) as f:
+                for name, (size, ts) in self.metadata.items():
+                    f.write(f"{name}\t{size}\t{ts!r}\n".encode())
+            os.replace(temp_path, self.metadata_file)
+            self._journal_lines = len(self.metadata)
         except Exception:
             pass
+        finally:
+            if not self._closed:
+                self._open_journal()
+
+    def _set_entry(self, name, size):
+        """Add or refresh an index entry with the current time."""
+        entry = (size, _now())
+        self.metadata[name] = entry
+        self.metadata.move_to_end(name)
+        self._append_journal(name, entry)
+
+    def _count(self, name, size, file_id):
+        """Add a file to the total size unless another name links it."""
+        refs = self._file_refs.setdefault(file_id, [0, size])
+        if refs[0] == 0:
+            self._total_size += size
+        refs[0] += 1
+        self._file_of[name] = file_id
+
+    def _uncount(self, name, size):
+        """Remove a file from the total size once no name links it."""
+        file_id = self._file_of.pop(name, None)
+        refs = self._file_refs.get(file_id)
+        if refs is None:
+            # Entry loaded from disk, counted on its own
+            self._total_size -= size
+            return
+        refs[0] -= 1
+        if refs[0] == 0:
+            del self._file_refs[file_id]
+            self._total_size -= refs[1]
+
+    def _touch(self, name):
+        """Record a cache hit in the index."""
+        if self.eviction == "fifo":
+            return
+        entry = self.metadata.get(name)
+        if entry is not None:
+            self._set_entry(name, entry[0])
+
+    def _remember(self, name, value):
+        """Keep a decoded value in memory, evicting the least recently used."""
+        if self.memory_items <= 0:
+            return
+        self._mem[name] = value
+        self._mem.move_to_end(name)
+        while len(self._mem) > self.memory_items:
+            self._mem.popitem(last=False)
 
-    def _get_cache_key(self, key):
+    def _forget_content(self, name):
+        """Stop using a file as the source for identical values."""
+        content_id = self._content_of.pop(name, None)
+        if self._content.get(content_id) == name:
+            del self._content[content_id]
+
+    def _remove_entry(self, name):
+        """Drop an index entry."""
+        self._mem.pop(name, None)
+        self._forget_content(name)
+        old = self.metadata.pop(name, None)
+        if old is not None:
+            self._uncount(name, old[0])
+            self._append_journal(name)
+
+    @staticmethod
+    def _get_cache_key(key):
         """Generate a safe filename from key."""
-        # Use hash of the full path to create a unique filename
-        key_hash = hashlib.md5(str(key).encode()).hexdigest()
-        return f"embedding_{key_hash}.pkl"
+        # Keys are converted first so that unhashable ones can be memoized
+        return _cache_file_name(str(key))
 
     def _get_cache_path(self, key):
         """Get full path for cache file."""
-        return self.cache_dir / self._get_cache_key(key)
+        return self._cache_dir_str + self._get_cache_key(key)
 
-    def _cleanup_old_files(self):
-        """Remove old cache files if size exceeds limit."""
+    @staticmethod
+    def _remove_file(path):
+        """Delete a file, ignoring errors."""
         try:
-            # Get all cache files with their sizes and access times
-            cache_files = []
-            total_size = 0
-            
-            for file_path in self.cache_dir.glob("embedding_*.pkl"):
-                if file_path.is_file():
-                    size = file_path.stat().st_size
-                    total_size += size
-                    
-                    # Get access time from metadata, fallback to file modification time
-                    access_time = self.metadata.get(file_path.name, file_path.stat().st_mtime)
-                    cache_files.append((file_path, size, access_time))
-            
-            # If total size exceeds limit, remove oldest files
-            if total_size > self.max_size_bytes:
-                # Sort by access time (oldest first)
-                cache_files.sort(key=lambda x: x[2])
-                
-                removed_size = 0
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _lock_for(self, name):
+        """Get the shard lock guarding a cache file."""
+        return self._shards[hash(name) % self.LOCK_SHARDS]
+
+    def _cleanup_old_files(self, keep=None):
+        """Evict old entries from the index if size exceeds limit.
+
+        The file named keep, usually the one just written, is never evicted.
+        Returns the names of the evicted files, which the caller deletes
+        after releasing the metadata lock.
+        """
+        evicted = []
+        try:
+            # If total size exceeds limit, remove files in eviction order
+            if self._total_size > self.max_size_bytes:
                 target_size = self.max_size_bytes * 0.8  # Remove until 80% of limit
+                newest_first = self.eviction == "mru"
+                kept = None
                 
-                for file_path, size, _ in cache_files:
-                    if total_size - removed_size <= target_size:
-                        break
-                    
-                    try:
-                        file_path.unlink()
-                        removed_size += size
-                        # Remove from metadata
-                        self.metadata.pop(file_path.name, None)
-                    except Exception:
-                        pass
+                while self.metadata and self._total_size > target_size:
+                    name, entry = self.metadata.popitem(last=newest_first)
+                    if name == keep:
+                        kept = entry
+                        continue
+                    self._uncount(name, entry[0])
+                    self._mem.pop(name, None)
+                    self._forget_content(name)
+                    evicted.append(name)
+                if kept is not None:
+                    self.metadata[keep] = kept
                 
-                self._save_metadata()
+                self._compact_metadata()
+            elif self._journal_lines > max(
+                self.JOURNAL_COMPACT_MIN_LINES, 2 * len(self.metadata)
+            ):
+                self._compact_metadata()
                 
         except Exception:
             pass
+        return evicted
 
     def get(self, key):
         """Get value from cache. Returns None if key is not present."""
-        with self.lock:
-            cache_path = self._get_cache_path(key)
-            
-            if not cache_path.exists():
-                return None
-            
-            try:
-                with open(cache_path, 'rb') as f:
-                    value = pickle.load(f)
-                
-                # Update access time
-                import time
-                self.metadata[cache_path.name] = time.time()
-                self._save_metadata()
-                
+        name = self._get_cache_key(key)
+        if name not in self.metadata:
+            return None
+
+        with self._meta_lock:
+            value = self._mem.get(name)
+            if value is not None:
+                self._mem.move_to_end(name)
+                self._touch(name)
                 return value
+
+        with self._lock_for(name):
+            try:
+                with open(
+                    self._cache_dir_str + name, 'rb', buffering=0
+                ) as f:
+                    value = _load(f)
             except Exception:
-                # If file is corrupted, remove it
-                try:
-                    cache_path.unlink()
-                    self.metadata.pop(cache_path.name, None)
-                except Exception:
-                    pass
+                # If file is missing or corrupted, forget about it
+                self._remove_file(self._cache_dir_str + name)
+                with self._meta_lock:
+                    self._remove_entry(name)
                 return None
 
+        # Update access time
+        with self._meta_lock:
+            if name in self.metadata:
+                self._touch(name)
+                self._remember(name, value)
+
+        return value
+
     def put(self, key, value):
         """Put value into cache."""
-        with self.lock:
+        name = self._get_cache_key(key)
+        cache_path = self._cache_dir_str + name
+        if self.durable:
+            # Save to temporary file first, then move to avoid corruption
+            write_path = cache_path[: -len(".pkl")] + ".tmp"
+        else:
+            write_path = cache_path
+        try:
+            payload, raws = _serialize(
+                _to_half(value) if self.half_precision else value
+            )
+        except Exception:
+            return
+        content_id = _content_id(payload, raws)
+
+        with self._lock_for(name):
+            with self._meta_lock:
+                old = self.metadata.get(name)
+                unchanged = self._content_of.get(name) == content_id
+            if old is not None and unchanged:
+                # The file already holds this value. Linking or writing it
+                # again would leave the temporary file behind when both
+                # names are links to the same file, so only refresh it.
+                with self._meta_lock:
+                    self._set_entry(name, old[0])
+                    self._remember(name, value)
+                return
             try:
-                cache_path = self._get_cache_path(key)
-                
-                # Save to temporary file first, then move to avoid corruption
-                temp_path = cache_path.with_suffix('.tmp')
-                with open(temp_path, 'wb') as f:
-                    pickle.dump(value, f)
-                
-                # Atomic move
-                shutil.move(str(temp_path), str(cache_path))
-                
-                # Update metadata
-                import time
-                self.metadata[cache_path.name] = time.time()
-                self._save_metadata()
-                
-                # Cleanup if needed
-                self._cleanup_old_files()
+                if not self.durable and old is not None:
+                    # Never truncate a file that may still be memory-mapped
+                    self._remove_file(cache_path)
+                size, file_id = self._link_content(
+                    content_id, name, write_path
+                )
+                if size is None:
+                    with open(
+                        write_path, 'wb', buffering=_IO_BUFFER_SIZE
+                    ) as f:
+                        _dump(payload, raws, f, self.compression_level)
+                        size = f.tell()
+                    file_id = object()
                 
+                if self.durable:
+                    # Atomic rename within the cache directory
+                    os.replace(write_path, cache_path)
             except Exception:
-                # Clean up temp file if it exists
-                temp_path = self._get_cache_path(key).with_suffix('.tmp')
-                if temp_path.exists():
-                    try:
-                        temp_path.unlink()
-                    except Exception:
-                        pass
+                # Clean up the partially written file if it exists
+                self._remove_file(write_path)
+                if not self.durable:
+                    with self._meta_lock:
+                        self._remove_entry(name)
+                return
+
+            # Update metadata while still holding the file lock, so that
+            # an eviction of this name never sees the new file unindexed
+            with self._meta_lock:
+                old = self.metadata.get(name)
+                if old is not None:
+                    self._uncount(name, old[0])
+                self._count(name, size, file_id)
+                self._set_entry(name, size)
+                self._remember(name, value)
+                self._forget_content(name)
+                self._content.setdefault(content_id, name)
+                self._content_of[name] = content_id
+
+                # Cleanup if needed
+                evicted = self._cleanup_old_files(keep=name)
+
+        # Delete evicted files after releasing the metadata lock. A get()
+        # racing with this sees a missing file and treats it as a miss.
+        for evicted_name in evicted:
+            with self._lock_for(evicted_name):
+                # Skip files written again since they were evicted
+                with self._meta_lock:
+                    if evicted_name in self.metadata:
+                        continue
+                self._remove_file(self._cache_dir_str + evicted_name)
+
+    def _link_content(self, content_id, name, link_path):
+        """Hard-link an existing file holding the same content to link_path.
+
+        Returns the size and id of the linked file, or (None, None) if there
+        is no such file or the filesystem does not support hard links.
+        """
+        with self._meta_lock:
+            source = self._content.get(content_id)
+            entry = self.metadata.get(source)
+            file_id = self._file_of.get(source)
+        if (
+            source is None
+            or source == name
+            or entry is None
+            or file_id is None
+        ):
+            return None, None
+        try:
+            os.link(self._cache_dir_str + source, link_path)
+        except OSError:
+            return None, None
+        return entry[0], file_id
 
     def find(self, key):
         """Returns True if key is in cache, False otherwise."""
-        with self.lock:
-            return self._get_cache_path(key).exists()
+        name = self._get_cache_key(key)
+        if name not in self.metadata:
+            return False
+        return os.path.exists(self._cache_dir_str + name)
 
     def clear(self):
         """Clear all cache files."""
-        with self.lock:
+        with self._meta_lock:
+            for name in self.metadata:
+                self._remove_file(self._cache_dir_str + name)
+            # Also remove files missing from the index, such as those
+            # written by another instance or left over by a crash
             try:
-                for file_path in self.cache_dir.glob("embedding_*.pkl"):
-                    file_path.unlink()
-                self.metadata.clear()
-                self._save_metadata()
-            except Exception:
+                with os.scandir(self.cache_dir) as it:
+                    for entry in it:
+                        name = entry.name
+                        if name.startswith("embedding_") or name.endswith(
+                            ".tmp"
+                        ):
+                            self._remove_file(entry.path)
+            except OSError:
                 pass
+            self.metadata.clear()
+            self._mem.clear()
+            self._content.clear()
+            self._content_of.clear()
+            self._file_of.clear()
+            self._file_refs.clear()
+            self._total_size = 0
+            self._compact_metadata()
 
     def get_cache_info(self):
         """Get cache statistics."""
-        with self.lock:
-            try:
-                cache_files = list(self.cache_dir.glob("embedding_*.pkl"))
-                total_size = sum(f.stat().st_size for f in cache_files if f.is_file())
-                return {
-                    'files': len(cache_files),
-                    'size_mb': total_size / (1024 * 1024),
-                    'size_gb': total_size / (1024 * 1024 * 1024),
-                    'cache_dir': str(self.cache_dir)
-                }
-            except Exception:
-                return {'files': 0, 'size_mb': 0, 'size_gb': 0, 'cache_dir': str(self.cache_dir)} 
\ No newline at end of file
+        with self._meta_lock:
+            return {
+                'files': len(self.metadata),
+                'size_mb': self._total_size / (1024 * 1024),
+                'size_gb': self._total_size / (1024 * 1024 * 1024),
+                'cache_dir': str(self.cache_dir)
+            }
@@ -297,7 +297,9 @@ class SAM_HQ(Model):
         # Cache for image embedding
         self.cache_size = 10
         self.preloaded_size = self.cache_size - 3
-        self.image_embedding_cache = PersistentCache()
+        self.image_embedding_cache = PersistentCache(
+            half_precision=self.config.get("cache_half_precision", False)
+        )
 
         # Pre-inference worker
         self.pre_inference_thread = None
@@ -480,6 +482,7 @@ class SAM_HQ(Model):
         self.stop_inference = True
         if self.pre_inference_thread:
             self.pre_inference_thread.quit()
+        self.image_embedding_cache.close()
 
     def preload_worker(self, files):
         """
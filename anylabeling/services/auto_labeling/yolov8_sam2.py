@@ -145,7 +145,9 @@ class YOLOv8SegmentAnything2(YOLO):
         # Cache for image embedding
         self.cache_size = 10
         self.preloaded_size = self.cache_size - 3
-        self.image_embedding_cache = PersistentCache()
+        self.image_embedding_cache = PersistentCache(
+            half_precision=self.config.get("cache_half_precision", False)
+        )
         self.current_image_embedding_cache = {}
 
         # Pre-inference worker
@@ -315,6 +317,7 @@ class YOLOv8SegmentAnything2(YOLO):
         self.stop_inference = True
         if self.pre_inference_thread:
             self.pre_inference_thread.quit
+        self.image_embedding_cache.close()
 
     def preload_worker(self, files):
         """
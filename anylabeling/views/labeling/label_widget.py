@@ -1739,20 +1739,8 @@ class LabelingWidget(LabelDialog):
         self.auto_labeling_widget.cache_auto_label_changed.connect(
             self.set_cache_auto_label
         )
-        self.auto_labeling_widget.model_manager.prediction_started.connect(
-            lambda: self.canvas.set_loading(True, self.tr("Please wait..."))
-        )
-        self.auto_labeling_widget.model_manager.prediction_finished.connect(
-            lambda: self.canvas.set_loading(False)
-        )
-        self.auto_labeling_widget.model_manager.prediction_finished.connect(
-            self.update_thumbnail_display
-        )
-        self.auto_labeling_widget.model_manager.model_loaded.connect(
-            self.update_thumbnail_display
-        )
-        self.next_files_changed.connect(
-            self.auto_labeling_widget.model_manager.on_next_files_changed
+        self.auto_labeling_widget.model_manager_created.connect(
+            self.on_model_manager_created
         )
         # NOTE(jack): this is not needed for now
         # self.auto_labeling_widget.model_manager.request_next_files_requested.connect(
@@ -1962,6 +1950,20 @@ class LabelingWidget(LabelDialog):
         self.canvas.set_auto_labeling(False)
         self.label_instruction.setText(self.get_labeling_instruction())
 
+    def on_model_manager_created(self, model_manager):
+        """Connect the model manager once the auto labeling widget creates it"""
+        model_manager.prediction_started.connect(
+            lambda: self.canvas.set_loading(True, self.tr("Please wait..."))
+        )
+        model_manager.prediction_finished.connect(
+            lambda: self.canvas.set_loading(False)
+        )
+        model_manager.prediction_finished.connect(
+            self.update_thumbnail_display
+        )
+        model_manager.model_loaded.connect(self.update_thumbnail_display)
+        self.next_files_changed.connect(model_manager.on_next_files_changed)
+
     def menu(self, title, actions=None):
         menu = self.parent.parent.menuBar().addMenu(title)
         if actions:
@@ -3605,6 +3607,8 @@ class LabelingWidget(LabelDialog):
     def closeEvent(self, event):
         if not self.may_continue():
             event.ignore()
+        else:
+            self.auto_labeling_widget.on_close()
         self.settings.setValue(
             "filename", self.filename if self.filename else ""
         )
@@ -4437,9 +4441,7 @@ class LabelingWidget(LabelDialog):
         self.thumbnail_image_label.clear()
         self.thumbnail_container.hide()
 
-        model_config = (
-            self.auto_labeling_widget.model_manager.loaded_model_config
-        )
+        model_config = self.auto_labeling_widget.loaded_model_config
         supported_model_list = list(_THUMBNAIL_RENDER_MODELS.keys())
         if not (
             model_config
@@ -1,3 +1,5 @@
+import functools
+
 from anylabeling.views.labeling.utils.qt import new_icon_path
 
 
@@ -168,6 +170,7 @@ def get_export_option_style():
     """
 
 
+@functools.lru_cache(maxsize=None)
 def get_normal_button_style():
     return """
         QPushButton {
@@ -187,6 +190,7 @@ def get_normal_button_style():
     """
 
 
+@functools.lru_cache(maxsize=None)
 def get_toggle_button_style(button_color: str):
     return f"""
         QPushButton {{
@@ -200,6 +204,7 @@ def get_toggle_button_style(button_color: str):
     """
 
 
+@functools.lru_cache(maxsize=None)
 def get_highlight_button_style():
     return """
         QPushButton {
@@ -251,6 +256,7 @@ def get_spinbox_style():
     """
 
 
+@functools.lru_cache(maxsize=None)
 def get_double_spinbox_style():
     """
     Returns the CSS stylesheet for a QDoubleSpinBox, suitable for decimals.
@@ -285,6 +291,7 @@ def get_double_spinbox_style():
     """
 
 
+@functools.lru_cache(maxsize=None)
 def get_lineedit_style():
     return """
         QLineEdit {
@@ -1,16 +1,32 @@
 import os
+import time
 import yaml
+import weakref
+import functools
 import collections
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 from PyQt5 import uic
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QPoint
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QPoint, QSignalBlocker
+from PyQt5.QtGui import QKeySequence
 from PyQt5.QtWidgets import (
     QDialog,
     QFileDialog,
+    QMessageBox,
+    QProgressBar,
+    QProgressDialog,
+    QShortcut,
     QWidget,
 )
 
 from anylabeling.services.auto_labeling.model_manager import ModelManager
+from anylabeling.services.auto_labeling.persistent_cache import (
+    get_default_cache_dir,
+)
 from anylabeling.services.auto_labeling.types import AutoLabelingMode
 from anylabeling.services.auto_labeling import (
     _AUTO_LABELING_IOU_MODELS,
@@ -26,6 +42,11 @@ from anylabeling.views.labeling.utils.style import (
     get_toggle_button_style,
 )
 from anylabeling.views.labeling.widgets.api_token_dialog import ApiTokenDialog
+from anylabeling.views.labeling.widgets.auto_labeling.preprocess import (
+    ClearCacheThread,
+    PreprocessThread,
+    get_image_encoder,
+)
 from anylabeling.views.labeling.widgets.searchable_model_dropdown import (
     load_json,
     save_json,
@@ -33,118 +54,366 @@ from anylabeling.views.labeling.widgets.searchable_model_dropdown import (
     SearchableModelDropdownPopup,
 )
 
+_AUTO_LABELING_IOU_MODELS_SET = frozenset(_AUTO_LABELING_IOU_MODELS)
+_AUTO_LABELING_CONF_MODELS_SET = frozenset(_AUTO_LABELING_CONF_MODELS)
+_SKIP_PREDICTION_ON_NEW_MARKS_MODELS_SET = frozenset(
+    _SKIP_PREDICTION_ON_NEW_MARKS_MODELS
+)
+
+# Mode keys of the mode comboboxes, in display order
+_UPN_MODES = ("coarse_grained_prompt", "fine_grained_prompt")
+_GROUNDING_DINO_MODES = (
+    "GroundingDino_1_6_Pro",
+    "GroundingDino_1_6_Edge",
+    "GroundingDino_1_5_Pro",
+    "GroundingDino_1_5_Edge",
+)
+_FLORENCE2_MODES = (
+    "caption",
+    "detailed_cap",
+    "more_detailed_cap",
+    "od",
+    "region_proposal",
+    "dense_region_cap",
+    "refer_exp_seg",
+    "region_to_seg",
+    "ovd",
+    "cap_to_pg",
+    "region_to_cat",
+    "region_to_desc",
+    "ocr",
+    "ocr_with_region",
+)
 
-class AutoLabelingWidget(QWidget):
+# Rectangle tools shared by the region-based Florence2 modes
+_FLORENCE2_REGION_TOOLS = (
+    "button_add_rect",
+    "button_clear",
+    "button_finish_object",
+)
+
+# Widgets needed for each Florence2 mode
+_FLORENCE2_MODE_WIDGETS = {
+    # Only need run button
+    "caption": ("button_run",),
+    "detailed_cap": ("button_run",),
+    "more_detailed_cap": ("button_run",),
+    "ocr": ("button_run",),
+    "ocr_with_region": ("button_run",),
+    "od": ("button_run",),
+    "region_proposal": ("button_run",),
+    "dense_region_cap": ("button_run",),
+    # Region-based modes need rectangle tools
+    "region_to_cat": _FLORENCE2_REGION_TOOLS,
+    "region_to_desc": _FLORENCE2_REGION_TOOLS,
+    "region_to_seg": _FLORENCE2_REGION_TOOLS,
+    # Other modes
+    "refer_exp_seg": ("edit_text", "button_send"),
+    "cap_to_pg": ("edit_text", "button_send"),
+    "ovd": ("edit_text", "button_send"),
+}
+
+# Default state of the preserve annotations toggle for each Florence2 mode
+_FLORENCE2_PRESERVE_MODES = {
+    # Modes that should preserve existing annotations (replace=False)
+    "region_to_cat": "Replace (Off)",
+    "region_to_desc": "Replace (Off)",
+    "region_to_seg": "Replace (Off)",
+    "refer_exp_seg": "Replace (Off)",
+    # Modes that should replace existing annotations (replace=True)
+    "caption": "Replace (On)",
+    "detailed_cap": "Replace (On)",
+    "more_detailed_cap": "Replace (On)",
+    "od": "Replace (On)",
+    "region_proposal": "Replace (On)",
+    "dense_region_cap": "Replace (On)",
+    "ovd": "Replace (On)",
+    "cap_to_pg": "Replace (On)",
+    "ocr": "Replace (On)",
+    "ocr_with_region": "Replace (On)",
+}
+
+# Widgets whose visibility depends on the Florence2 mode, and the ones
+# to hide for each mode
+_FLORENCE2_MANAGED_WIDGETS = (
+    "edit_text",
+    "button_run",
+    "button_send",
+    "button_add_rect",
+    "button_clear",
+    "button_finish_object",
+)
+_FLORENCE2_HIDDEN_WIDGETS = {
+    mode: tuple(
+        name for name in _FLORENCE2_MANAGED_WIDGETS if name not in widgets
+    )
+    for mode, widgets in _FLORENCE2_MODE_WIDGETS.items()
+}
+
+# Style sheet of the preprocessing progress dialog
+_PREPROCESS_DIALOG_QSS = """
+QProgressDialog {
+    background-color: rgba(255, 255, 255, 0.95);
+    border-radius: 12px;
+    min-width: 280px;
+    min-height: 120px;
+    padding: 20px;
+}
+QProgressBar {
+    border: none;
+    border-radius: 4px;
+    background-color: rgba(0, 0, 0, 0.05);
+    text-align: center;
+    color: #1d1d1f;
+    font-size: 13px;
+    min-height: 20px;
+    max-height: 20px;
+    margin: 16px 0;
+}
+QProgressBar::chunk {
+    background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
+        stop:0 #0066FF,
+        stop:0.5 #00A6FF,
+        stop:1 #0066FF);
+    border-radius: 3px;
+}
+QLabel {
+    color: #1d1d1f;
+    font-size: 13px;
+    font-weight: 500;
+    margin-bottom: 8px;
+}
+QPushButton {
+    background-color: rgba(255, 255, 255, 0.8);
+    border: 0.5px solid rgba(0, 0, 0, 0.1);
+    border-radius: 6px;
+    font-weight: 500;
+    font-size: 13px;
+    color: #0066FF;
+    min-width: 82px;
+    height: 36px;
+    padding: 0 16px;
+    margin-top: 16px;
+}
+QPushButton:hover {
+    background-color: rgba(0, 0, 0, 0.05);
+}
+"""
+
+# Compile the .ui file into a form class once, so that constructing the
+# widget only runs the generated setupUi instead of re-parsing the XML
+_AutoLabelingForm, _ = uic.loadUiType(
+    os.path.join(os.path.dirname(__file__), "auto_labeling.ui"),
+    from_imports=True,
+    resource_suffix="",
+    import_from="anylabeling.resources",
+)
+
+
+class AutoLabelingWidget(QWidget, _AutoLabelingForm):
     new_model_selected = pyqtSignal(str)
     new_custom_model_selected = pyqtSignal(str)
     auto_segmentation_requested = pyqtSignal()
     auto_segmentation_disabled = pyqtSignal()
     auto_labeling_mode_changed = pyqtSignal(AutoLabelingMode)
+    model_manager_created = pyqtSignal(ModelManager)
     clear_auto_labeling_action_requested = pyqtSignal()
     finish_auto_labeling_object_action_requested = pyqtSignal()
     cache_auto_label_changed = pyqtSignal()
 
+    _ZERO_POINT = QPoint(0, 0)
+
+    # The preprocess progress dialog is refreshed every this many images
+    # or after this many seconds, whichever comes first
+    _PREPROCESS_PROGRESS_STEP = 10
+    _PREPROCESS_PROGRESS_INTERVAL = 0.1
+
+    # Optional widgets, shown on demand by the loaded model
+    _LABELING_WIDGETS = (
+        "button_run",
+        "button_add_point",
+        "button_remove_point",
+        "button_add_rect",
+        "button_clear",
+        "button_finish_object",
+        "button_preprocess_all",
+        "button_clear_cache",
+        "button_send",
+        "edit_text",
+        "edit_conf",
+        "edit_iou",
+        "input_box_thres",
+        "input_conf",
+        "input_iou",
+        "output_label",
+        "output_select_combobox",
+        "toggle_preserve_existing_annotations",
+        "button_set_api_token",
+        "button_reset_tracker",
+        "upn_select_combobox",
+        "gd_select_combobox",
+        "florence2_select_combobox",
+    )
+
     def __init__(self, parent):
         super().__init__()
-        self.parent = parent
-        current_dir = os.path.dirname(__file__)
-        uic.loadUi(os.path.join(current_dir, "auto_labeling.ui"), self)
-
-        self.model_manager = ModelManager()
-        self.model_manager.new_model_status.connect(self.on_new_model_status)
-        self.new_model_selected.connect(self.model_manager.load_model)
-        self.new_custom_model_selected.connect(
-            self.model_manager.load_custom_model
-        )
-        self.model_manager.model_loaded.connect(self.update_visible_widgets)
-        self.model_manager.model_loaded.connect(self.on_new_model_loaded)
-        self.model_manager.new_auto_labeling_result.connect(
-            lambda auto_labeling_result: self.parent.new_shapes_from_auto_labeling(
-                auto_labeling_result
-            )
-        )
-        self.model_manager.auto_segmentation_model_selected.connect(
-            self.auto_segmentation_requested
-        )
-        self.model_manager.auto_segmentation_model_unselected.connect(
-            self.auto_segmentation_disabled
-        )
-        self.model_manager.output_modes_changed.connect(
-            self.on_output_modes_changed
+        # Weak proxy to the labeling widget, which owns this widget; a
+        # plain attribute would also shadow QWidget.parent()
+        self._parent = weakref.proxy(parent)
+        self.setupUi(self)
+
+        # The model manager is created on first use, see model_manager
+        self._model_manager = None
+
+        # Tools that are disabled while inference is running
+        self._tool_widgets = (
+            self.model_selection_button,
+            self.output_select_combobox,
+            self.button_add_point,
+            self.button_remove_point,
+            self.button_add_rect,
+            self.button_clear,
+            self.button_finish_object,
+            self.upn_select_combobox,
+            self.gd_select_combobox,
+            self.florence2_select_combobox,
         )
+
         self.output_select_combobox.currentIndexChanged.connect(
-            lambda: self.model_manager.set_output_mode(
-                self.output_select_combobox.currentData()
-            )
-        )
-        self.upn_select_combobox.currentIndexChanged.connect(
-            self.on_upn_mode_changed
-        )
-        self.florence2_select_combobox.currentIndexChanged.connect(
-            self.on_florence2_mode_changed
-        )
-        self.gd_select_combobox.currentIndexChanged.connect(
-            self.on_gd_mode_changed
+            self.on_output_mode_changed
         )
 
-        # Disable tools when inference is running
-        def set_enable_tools(enable):
-            self.model_selection_button.setEnabled(enable)
-            self.output_select_combobox.setEnabled(enable)
-            self.button_add_point.setEnabled(enable)
-            self.button_remove_point.setEnabled(enable)
-            self.button_add_rect.setEnabled(enable)
-            self.button_clear.setEnabled(enable)
-            self.button_finish_object.setEnabled(enable)
-            self.upn_select_combobox.setEnabled(enable)
-            self.gd_select_combobox.setEnabled(enable)
-            self.florence2_select_combobox.setEnabled(enable)
-
-        self.model_manager.prediction_started.connect(
-            lambda: set_enable_tools(False)
-        )
-        self.model_manager.prediction_finished.connect(
-            lambda: set_enable_tools(True)
-        )
+        # Mode comboboxes of models with switchable prompt modes,
+        # keyed by model type: (combobox, model manager setter name)
+        self._mode_registry = {
+            "upn": (self.upn_select_combobox, "set_upn_mode"),
+            "groundingdino": (
+                self.gd_select_combobox,
+                "set_groundingdino_mode",
+            ),
+            "florence2": (
+                self.florence2_select_combobox,
+                "set_florence2_mode",
+            ),
+        }
+        for kind, (combobox, _) in self._mode_registry.items():
+            combobox.currentIndexChanged.connect(
+                functools.partial(self._on_mode_changed, kind)
+            )
 
         # Init value
         self.initial_conf_value = 0
         self.initial_iou_value = 0
         self.initial_preserve_annotations_state = False
+        self.preprocess_thread = None
+        self.preprocess_canceled = False
+        self.preprocess_progress = None
+        self.clear_cache_thread = None
 
         # ===================================
         #  Auto labeling buttons
         # ===================================
 
         # --- Configuration for: model_selection_button ---
-        model_data = self.init_model_data()
-        self.model_dropdown = SearchableModelDropdownPopup(model_data)
+        # Model data is loaded the first time the dropdown is opened
+        self._model_data = {}
+        self._model_data_loaded = False
+        self._dropdown_size_dirty = True
+        self.model_info = {}
+        self.model_dropdown = SearchableModelDropdownPopup(self._model_data)
         self.model_dropdown.hide()
         self.model_dropdown.modelSelected.connect(self.on_model_selected)
-        self.model_selection_button.setStyleSheet(get_normal_button_style())
-        self.model_selection_button.clicked.connect(self.show_model_dropdown)
-
-        # --- Configuration for: button_run ---
-        self.button_run.setShortcut("I")
-        self.button_run.setStyleSheet(get_highlight_button_style())
-        self.button_run.clicked.connect(self.run_prediction)
 
-        # --- Configuration for: button_reset_tracker ---
-        self.button_reset_tracker.setStyleSheet(get_normal_button_style())
-        self.button_reset_tracker.clicked.connect(self.on_reset_tracker)
+        # --- Configuration for: push buttons ---
+        # (button name, style, shortcut, clicked slot)
+        normal_style = get_normal_button_style()
+        highlight_style = get_highlight_button_style()
+        button_spec = (
+            (
+                "model_selection_button",
+                normal_style,
+                None,
+                self.show_model_dropdown,
+            ),
+            ("button_run", highlight_style, "I", self.run_prediction),
+            (
+                "button_reset_tracker",
+                normal_style,
+                None,
+                self.on_reset_tracker,
+            ),
+            (
+                "button_set_api_token",
+                normal_style,
+                None,
+                self.on_set_api_token,
+            ),
+            ("button_send", highlight_style, None, self.run_vl_prediction),
+            (
+                "button_add_point",
+                normal_style,
+                "Q",
+                lambda: self.set_auto_labeling_mode(
+                    AutoLabelingMode.ADD, AutoLabelingMode.POINT
+                ),
+            ),
+            (
+                "button_remove_point",
+                normal_style,
+                "E",
+                lambda: self.set_auto_labeling_mode(
+                    AutoLabelingMode.REMOVE, AutoLabelingMode.POINT
+                ),
+            ),
+            (
+                "button_add_rect",
+                normal_style,
+                None,
+                lambda: self.set_auto_labeling_mode(
+                    AutoLabelingMode.ADD, AutoLabelingMode.RECTANGLE
+                ),
+            ),
+            (
+                "button_clear",
+                normal_style,
+                "B",
+                self.clear_auto_labeling_action_requested,
+            ),
+            (
+                "button_finish_object",
+                normal_style,
+                "F",
+                self.on_finish_object,
+            ),
+            (
+                "button_preprocess_all",
+                normal_style,
+                "P",
+                self.preprocess_all_images,
+            ),
+            ("button_clear_cache", normal_style, None, self.clear_cache),
+        )
+        # Shortcuts are owned by their button, so they are only active
+        # while the button is visible and enabled
+        self._shortcuts = []
+        for name, style, shortcut, slot in button_spec:
+            button = getattr(self, name)
+            button.setStyleSheet(style)
+            if shortcut:
+                self._shortcuts.append(
+                    QShortcut(
+                        QKeySequence(shortcut),
+                        button,
+                        activated=button.animateClick,
+                    )
+                )
+            button.clicked.connect(slot)
 
-        # --- Configuration for: button_set_api_token ---
-        self.button_set_api_token.setStyleSheet(get_normal_button_style())
         self.button_set_api_token.setToolTip(
             self.tr(
                 "You can set the API token via the GROUNDING_DINO_API_TOKEN environment variable"
             )
         )
-        self.button_set_api_token.clicked.connect(self.on_set_api_token)
-
-        # --- Configuration for: button_send ---
-        self.button_send.setStyleSheet(get_highlight_button_style())
-        self.button_send.clicked.connect(self.run_vl_prediction)
 
         # --- Configuration for: edit_conf ---
         self.edit_conf.setStyleSheet(get_double_spinbox_style())
@@ -157,54 +426,6 @@ class AutoLabelingWidget(QWidget):
         # --- Configuration for: edit_text ---
         self.edit_text.setStyleSheet(get_lineedit_style())
 
-        # --- Configuration for: button_add_point ---
-        self.button_add_point.setShortcut("Q")
-        self.button_add_point.clicked.connect(
-            lambda: self.set_auto_labeling_mode(
-                AutoLabelingMode.ADD, AutoLabelingMode.POINT
-            )
-        )
-
-        # --- Configuration for: button_remove_point ---
-        self.button_remove_point.setShortcut("E")
-        self.button_remove_point.clicked.connect(
-            lambda: self.set_auto_labeling_mode(
-                AutoLabelingMode.REMOVE, AutoLabelingMode.POINT
-            )
-        )
-
-        # --- Configuration for: button_add_rect ---
-        self.button_add_rect.clicked.connect(
-            lambda: self.set_auto_labeling_mode(
-                AutoLabelingMode.ADD, AutoLabelingMode.RECTANGLE
-            )
-        )
-
-        # --- Configuration for: button_clear ---
-        self.button_clear.clicked.connect(
-            self.clear_auto_labeling_action_requested
-        )
-        self.button_clear.setShortcut("B")
-
-        # --- Configuration for: button_finish_object ---
-        self.button_finish_object.clicked.connect(self.add_new_prompt)
-        self.button_finish_object.clicked.connect(
-            self.finish_auto_labeling_object_action_requested
-        )
-        self.button_finish_object.clicked.connect(
-            self.cache_auto_label_changed
-        )
-        self.button_finish_object.setShortcut("F")
-
-        # --- Configuration for: button_preprocess_all ---
-        self.button_preprocess_all.clicked.connect(self.preprocess_all_images)
-        self.button_preprocess_all.setShortcut("P")
-        self.button_preprocess_all.setStyleSheet(get_normal_button_style())
-
-        # --- Configuration for: button_clear_cache ---
-        self.button_clear_cache.clicked.connect(self.clear_cache)
-        self.button_clear_cache.setStyleSheet(get_normal_button_style())
-
         # --- Configuration for: toggle_preserve_existing_annotations ---
         self.toggle_preserve_existing_annotations.setChecked(False)
         self.toggle_preserve_existing_annotations.setCheckable(True)
@@ -244,6 +465,9 @@ class AutoLabelingWidget(QWidget):
         # Handle close button
         self.button_close.clicked.connect(self.unload_and_hide)
 
+        # Mode buttons start unhighlighted, afterwards update_button_colors
+        # only restyles the buttons whose highlight changes
+        self._active_mode_button = None
         self.auto_labeling_mode_changed.connect(self.update_button_colors)
         self.auto_labeling_mode = AutoLabelingMode.NONE
         self.auto_labeling_mode_changed.emit(self.auto_labeling_mode)
@@ -253,8 +477,75 @@ class AutoLabelingWidget(QWidget):
         self.populate_florence2_combobox()
         self.populate_gd_combobox()
 
+    @property
+    def model_manager(self):
+        """Model manager, created and connected on first access"""
+        return self._ensure_model_manager()
+
+    def _ensure_model_manager(self):
+        """Create the model manager if it does not exist yet.
+
+        An AttributeError raised while creating it is re-raised as a
+        RuntimeError, so the property lookup does not hide it.
+        """
+        if self._model_manager is None:
+            try:
+                model_manager = self._create_model_manager()
+            except AttributeError as e:
+                raise RuntimeError(
+                    f"Failed to create the model manager: {e}"
+                ) from e
+            self._model_manager = model_manager
+            self.model_manager_created.emit(model_manager)
+        return self._model_manager
+
+    @property
+    def loaded_model_config(self):
+        """Loaded model config, without creating the model manager"""
+        if self._model_manager is None:
+            return None
+        return self._model_manager.loaded_model_config
+
+    def _create_model_manager(self):
+        """Create the model manager and connect its signals"""
+        model_manager = ModelManager()
+        model_manager.new_model_status.connect(self.on_new_model_status)
+        self.new_model_selected.connect(model_manager.load_model)
+        self.new_custom_model_selected.connect(model_manager.load_custom_model)
+        model_manager.model_loaded.connect(self.update_visible_widgets)
+        model_manager.model_loaded.connect(self.on_new_model_loaded)
+        model_manager.new_auto_labeling_result.connect(
+            lambda auto_labeling_result: self._parent.new_shapes_from_auto_labeling(
+                auto_labeling_result
+            )
+        )
+        model_manager.auto_segmentation_model_selected.connect(
+            self.auto_segmentation_requested
+        )
+        model_manager.auto_segmentation_model_unselected.connect(
+            self.auto_segmentation_disabled
+        )
+        model_manager.output_modes_changed.connect(
+            self.on_output_modes_changed
+        )
+
+        # Disable tools when inference is running
+        model_manager.prediction_started.connect(
+            functools.partial(self._set_tools_enabled, False)
+        )
+        model_manager.prediction_finished.connect(
+            functools.partial(self._set_tools_enabled, True)
+        )
+
+        return model_manager
+
+    def _set_tools_enabled(self, enable):
+        """Enable or disable the tools while inference is running"""
+        for widget in self._tool_widgets:
+            widget.setEnabled(enable)
+
     def init_model_data(self):
-        """Get models data"""
+        """Build models data and cache it in self._model_data"""
         model_data = {
             "Custom": {
                 "load_custom_model": {
@@ -273,10 +564,17 @@ class AutoLabelingWidget(QWidget):
 
         try:
             local_model_data = load_json(_MODELS_CONFIG_PATH)["models_data"]
+            existing_paths = self._find_existing_paths(
+                model_dict["config_path"]
+                for model_name, model_dict in local_model_data[
+                    "Custom"
+                ].items()
+                if model_name != "load_custom_model"
+            )
             for model_name, model_dict in local_model_data["Custom"].items():
                 if model_name == "load_custom_model":
                     continue
-                elif not os.path.exists(model_dict["config_path"]):
+                elif model_dict["config_path"] not in existing_paths:
                     continue
 
                 if not model_name.startswith("_custom_"):
@@ -297,6 +595,14 @@ class AutoLabelingWidget(QWidget):
         except Exception as _:
             local_model_data = {}
 
+        # Saved dropdown state is merged once per provider
+        local_model_lookup = {
+            (provider_name, model_name)
+            for provider_name, models in local_model_data.items()
+            for model_name in models
+        }
+        merged_providers = set()
+
         model_list = self.model_manager.get_model_configs()
         for model_dict in model_list:
             model_name = model_dict["name"]
@@ -308,14 +614,13 @@ class AutoLabelingWidget(QWidget):
             if provider_name not in model_data:
                 model_data[provider_name] = {}
 
-            if (
-                provider_name in local_model_data
-                and model_name in local_model_data[provider_name]
-            ):
+            if (provider_name, model_name) in local_model_lookup:
                 local_model_data[provider_name][model_name]["selected"] = False
-                model_data[provider_name].update(
-                    local_model_data[provider_name]
-                )
+                if provider_name not in merged_providers:
+                    model_data[provider_name].update(
+                        local_model_data[provider_name]
+                    )
+                    merged_providers.add(provider_name)
             else:
                 model_data[provider_name][model_name] = {
                     "selected": False,
@@ -333,9 +638,36 @@ class AutoLabelingWidget(QWidget):
             }
 
         # Sort the collected model_data
-        sorted_model_data = self._sort_model_data(model_data)
+        self._model_data = self._sort_model_data(model_data)
 
-        return sorted_model_data
+        return self._model_data
+
+    @staticmethod
+    def _find_existing_paths(paths) -> set:
+        """Returns the given paths that exist, listing each directory once
+
+        The paths are returned as given. Names are compared after
+        os.path.normcase, so the lookup is case-insensitive on Windows.
+        """
+        paths_by_dir = collections.defaultdict(
+            lambda: collections.defaultdict(list)
+        )
+        for path in paths:
+            dirname, basename = os.path.split(path)
+            paths_by_dir[dirname][os.path.normcase(basename)].append(path)
+
+        existing_paths = set()
+        for dirname, paths_by_name in paths_by_dir.items():
+            try:
+                with os.scandir(dirname or os.curdir) as entries:
+                    present = {
+                        os.path.normcase(entry.name) for entry in entries
+                    }
+            except OSError:
+                continue
+            for name in paths_by_name.keys() & present:
+                existing_paths.update(paths_by_name[name])
+        return existing_paths
 
     def _sort_model_data(self, model_data: dict) -> collections.OrderedDict:
         """Sorts the model data dictionary"""
@@ -347,28 +679,47 @@ class AutoLabelingWidget(QWidget):
                 return (2,)
             return (1, key)
 
-        def inner_sort_key(item: tuple[str, dict]):
-            _, model_details = item
-            display_name = model_details.get("display_name", "")
-            if display_name == "...Load Custom Model":
-                return (0,)
-            return (1, display_name)
-
         sorted_top_keys = sorted(model_data.keys(), key=top_level_sort_key)
         sorted_data = collections.OrderedDict()
         for key in sorted_top_keys:
-            inner_dict = model_data[key]
-            sorted_inner_items = sorted(inner_dict.items(), key=inner_sort_key)
-            sorted_data[key] = collections.OrderedDict(sorted_inner_items)
+            sorted_data[key] = self._sort_models(model_data[key])
         return sorted_data
 
+    @staticmethod
+    def _sort_models(models: dict) -> collections.OrderedDict:
+        """Sorts the models of one provider by display name"""
+        sorted_models = collections.OrderedDict()
+        display_names = {}
+        for model_name, model_details in models.items():
+            display_name = model_details.get("display_name", "")
+            # The custom model loader always stays on top
+            if display_name == "...Load Custom Model":
+                sorted_models[model_name] = model_details
+            else:
+                display_names[model_name] = display_name
+
+        for model_name in sorted(display_names, key=display_names.__getitem__):
+            sorted_models[model_name] = models[model_name]
+        return sorted_models
+
     def show_model_dropdown(self):
         """Show the model dropdown"""
-        button_pos = self.model_selection_button.mapToGlobal(QPoint(0, 0))
+        if not self._model_data_loaded:
+            self.update_model_dropdown(self.init_model_data())
+            self._model_data_loaded = True
+        button_pos = self.model_selection_button.mapToGlobal(self._ZERO_POINT)
         self.model_dropdown.move(int(button_pos.x()), int(button_pos.y()))
-        self.model_dropdown.adjustSize()
+        # Only recompute the layout after the model list has changed
+        if self._dropdown_size_dirty:
+            self.model_dropdown.adjustSize()
+            self._dropdown_size_dirty = False
         self.model_dropdown.show()
 
+    def update_model_dropdown(self, model_data):
+        """Rebuild the model dropdown list from model_data"""
+        self.model_dropdown.update_models_data(model_data)
+        self._dropdown_size_dirty = True
+
     def on_model_selected(self, provider, model_name):
         """Handle the model selected event"""
 
@@ -391,7 +742,7 @@ class AutoLabelingWidget(QWidget):
 
                 # update model_info
                 with open(config_file, "r", encoding="utf-8") as f:
-                    config_info = yaml.safe_load(f)
+                    config_info = yaml.load(f, Loader=SafeLoader)
 
                 if not config_info["name"].startswith("_custom_"):
                     config_info["name"] = f"_custom_{config_info['name']}"
@@ -401,17 +752,22 @@ class AutoLabelingWidget(QWidget):
                     "config_path": config_file,
                 }
 
-                # update model_data
-                models_data = self.init_model_data()
-                models_data["Custom"]["load_custom_model"]["selected"] = False
-                models_data["Custom"][config_info["name"]] = {
+                # update model_data in place, re-sorting only the custom models
+                for models in self._model_data.values():
+                    for model_details in models.values():
+                        model_details["selected"] = False
+                custom_models = self._model_data["Custom"]
+                custom_models[config_info["name"]] = {
                     "selected": True,
                     "favorite": False,
                     "display_name": config_info["display_name"],
                     "config_path": config_file,
                 }
-                save_json({"models_data": models_data}, _MODELS_CONFIG_PATH)
-                self.model_dropdown.update_models_data(models_data)
+                self._model_data["Custom"] = self._sort_models(custom_models)
+                save_json(
+                    {"models_data": self._model_data}, _MODELS_CONFIG_PATH
+                )
+                self.update_model_dropdown(self._model_data)
 
                 self.clear_auto_labeling_action_requested.emit()
                 self.model_selection_button.setText(
@@ -438,87 +794,91 @@ class AutoLabelingWidget(QWidget):
                 self.model_info[model_name]["config_path"]
             )
 
+    @staticmethod
+    def _populate_mode_combobox(combobox, modes, display_names):
+        """Fill a mode combobox, emitting a single index change at the end"""
+        combobox.blockSignals(True)
+        try:
+            combobox.clear()
+            combobox.addItems(display_names)
+            for index, mode in enumerate(modes):
+                combobox.setItemData(index, mode)
+        finally:
+            combobox.blockSignals(False)
+        combobox.currentIndexChanged.emit(combobox.currentIndex())
+
     def populate_upn_combobox(self):
         """Populate UPN combobox with available modes"""
-        self.upn_select_combobox.clear()
-        # Define modes with display names
-        modes = {
-            "coarse_grained_prompt": self.tr("Coarse Grained"),
-            "fine_grained_prompt": self.tr("Fine Grained"),
-        }
-        # Add modes to combobox
-        for mode, display_name in modes.items():
-            self.upn_select_combobox.addItem(display_name, userData=mode)
+        display_names = [
+            self.tr("Coarse Grained"),
+            self.tr("Fine Grained"),
+        ]
+        self._populate_mode_combobox(
+            self.upn_select_combobox, _UPN_MODES, display_names
+        )
 
     def populate_gd_combobox(self):
         """Populate GroundingDino combobox with available modes"""
-        self.gd_select_combobox.clear()
-        # Define modes with display names
-        modes = {
-            "GroundingDino_1_6_Pro": "GroundingDino-1.6-Pro",
-            "GroundingDino_1_6_Edge": "GroundingDino-1.6-Edge",
-            "GroundingDino_1_5_Pro": "GroundingDino-1.5-Pro",
-            "GroundingDino_1_5_Edge": "GroundingDino-1.5-Edge",
-        }
-        # Add modes to combobox
-        for mode, display_name in modes.items():
-            self.gd_select_combobox.addItem(display_name, userData=mode)
+        display_names = [
+            "GroundingDino-1.6-Pro",
+            "GroundingDino-1.6-Edge",
+            "GroundingDino-1.5-Pro",
+            "GroundingDino-1.5-Edge",
+        ]
+        self._populate_mode_combobox(
+            self.gd_select_combobox, _GROUNDING_DINO_MODES, display_names
+        )
 
     def populate_florence2_combobox(self):
         """Populate Florence2 combobox with available modes"""
-        self.florence2_select_combobox.clear()
-        # Define modes with display names
-        modes = {
-            "caption": self.tr("Caption"),
-            "detailed_cap": self.tr("Detailed Caption"),
-            "more_detailed_cap": self.tr("More Detailed Caption"),
-            "od": self.tr("Object Detection"),
-            "region_proposal": self.tr("Region Proposal"),
-            "dense_region_cap": self.tr("Dense Region Caption"),
-            "refer_exp_seg": self.tr("Refer-Exp Segmentation"),
-            "region_to_seg": self.tr("Region to Segmentation"),
-            "ovd": self.tr("OVD"),
-            "cap_to_pg": self.tr("Caption to Parse Grounding"),
-            "region_to_cat": self.tr("Region to Category"),
-            "region_to_desc": self.tr("Region to Description"),
-            "ocr": self.tr("OCR"),
-            "ocr_with_region": self.tr("OCR with Region"),
-        }
-        # Add modes to combobox
-        for mode, display_name in modes.items():
-            self.florence2_select_combobox.addItem(display_name, userData=mode)
+        display_names = [
+            self.tr("Caption"),
+            self.tr("Detailed Caption"),
+            self.tr("More Detailed Caption"),
+            self.tr("Object Detection"),
+            self.tr("Region Proposal"),
+            self.tr("Dense Region Caption"),
+            self.tr("Refer-Exp Segmentation"),
+            self.tr("Region to Segmentation"),
+            self.tr("OVD"),
+            self.tr("Caption to Parse Grounding"),
+            self.tr("Region to Category"),
+            self.tr("Region to Description"),
+            self.tr("OCR"),
+            self.tr("OCR with Region"),
+        ]
+        self._populate_mode_combobox(
+            self.florence2_select_combobox, _FLORENCE2_MODES, display_names
+        )
 
     @pyqtSlot()
     def update_button_colors(self):
         """Update button colors"""
-        for button in [
-            self.button_add_point,
-            self.button_remove_point,
-            self.button_add_rect,
-            self.button_clear,
-            self.button_finish_object,
-        ]:
-            button.setStyleSheet(get_normal_button_style())
-        if self.auto_labeling_mode == AutoLabelingMode.NONE:
-            return
-        if self.auto_labeling_mode.edit_mode == AutoLabelingMode.ADD:
-            if self.auto_labeling_mode.shape_type == AutoLabelingMode.POINT:
-                self.button_add_point.setStyleSheet(
-                    get_toggle_button_style(button_color="#90EE90")
-                )
-            elif (
-                self.auto_labeling_mode.shape_type
-                == AutoLabelingMode.RECTANGLE
-            ):
-                self.button_add_rect.setStyleSheet(
-                    get_toggle_button_style(button_color="#90EE90")
-                )
-        elif self.auto_labeling_mode.edit_mode == AutoLabelingMode.REMOVE:
-            if self.auto_labeling_mode.shape_type == AutoLabelingMode.POINT:
-                self.button_remove_point.setStyleSheet(
-                    get_toggle_button_style(button_color="#FFB6C1")
+        target_button, button_color = None, None
+        edit_mode = self.auto_labeling_mode.edit_mode
+        shape_type = self.auto_labeling_mode.shape_type
+        if edit_mode == AutoLabelingMode.ADD:
+            if shape_type == AutoLabelingMode.POINT:
+                target_button, button_color = self.button_add_point, "#90EE90"
+            elif shape_type == AutoLabelingMode.RECTANGLE:
+                target_button, button_color = self.button_add_rect, "#90EE90"
+        elif edit_mode == AutoLabelingMode.REMOVE:
+            if shape_type == AutoLabelingMode.POINT:
+                target_button, button_color = (
+                    self.button_remove_point,
+                    "#FFB6C1",
                 )
 
+        if target_button is self._active_mode_button:
+            return
+        if self._active_mode_button is not None:
+            self._active_mode_button.setStyleSheet(get_normal_button_style())
+        if target_button is not None:
+            target_button.setStyleSheet(
+                get_toggle_button_style(button_color=button_color)
+            )
+        self._active_mode_button = target_button
+
     def set_auto_labeling_mode(self, edit_mode, shape_type=None):
         """Set auto labeling mode"""
         if edit_mode is None:
@@ -529,17 +889,17 @@ class AutoLabelingWidget(QWidget):
 
     def run_prediction(self):
         """Run prediction"""
-        if self.parent.filename is not None:
+        if self._parent.filename is not None:
             self.model_manager.predict_shapes_threading(
-                self.parent.image, self.parent.filename
+                self._parent.image, self._parent.filename
             )
 
     def run_vl_prediction(self):
         """Run visual-language prediction"""
-        if self.parent.filename is not None and self.edit_text:
+        if self._parent.filename is not None and self.edit_text:
             self.model_manager.predict_shapes_threading(
-                self.parent.image,
-                self.parent.filename,
+                self._parent.image,
+                self._parent.filename,
                 text_prompt=self.edit_text.text(),
             )
 
@@ -555,14 +915,10 @@ class AutoLabelingWidget(QWidget):
         self.model_selection_button.setEnabled(True)
 
         # Reset controls to initial values when the model changes
+        cfg = self.model_manager.loaded_model_config
         try:
-            if (
-                self.model_manager.loaded_model_config["type"]
-                in _AUTO_LABELING_IOU_MODELS
-            ):
-                initial_iou_value = self.model_manager.loaded_model_config[
-                    "iou_threshold"
-                ]
+            if cfg["type"] in _AUTO_LABELING_IOU_MODELS_SET:
+                initial_iou_value = cfg["iou_threshold"]
                 self.edit_iou.setValue(initial_iou_value)
             else:
                 initial_iou_value = 0.0
@@ -572,13 +928,8 @@ class AutoLabelingWidget(QWidget):
             self.edit_iou.setValue(initial_iou_value)
 
         try:
-            if (
-                self.model_manager.loaded_model_config["type"]
-                in _AUTO_LABELING_CONF_MODELS
-            ):
-                initial_conf_value = self.model_manager.loaded_model_config[
-                    "conf_threshold"
-                ]
+            if cfg["type"] in _AUTO_LABELING_CONF_MODELS_SET:
+                initial_conf_value = cfg["conf_threshold"]
                 self.edit_conf.setValue(initial_conf_value)
             else:
                 initial_conf_value = 0.0
@@ -595,61 +946,39 @@ class AutoLabelingWidget(QWidget):
         )
 
         # Update specific mode in UI if specific model is loaded
-        if model_config.get("type") == "upn":
-            self.update_upn_mode_ui()
-        elif model_config.get("type") == "florence2":
-            self.update_florence2_mode_ui()
-        elif model_config.get("type") == "groundingdino":
-            self.update_groundingdino_mode_ui()
-
-    def update_upn_mode_ui(self):
-        """Update UPN mode combobox to reflect current backend state"""
-        current_mode = self.model_manager.loaded_model_config[
-            "model"
-        ].prompt_type
-        index = self.upn_select_combobox.findData(current_mode)
-        if index != -1:
-            self.upn_select_combobox.setCurrentIndex(index)
-
-    def update_groundingdino_mode_ui(self):
-        """Update GroundingDino mode combobox to reflect current backend state"""
-        current_mode = self.model_manager.loaded_model_config[
-            "model"
-        ].prompt_type
-        index = self.gd_select_combobox.findData(current_mode)
+        model_type = model_config.get("type")
+        if model_type in self._mode_registry:
+            self._update_mode_ui(model_type)
+
+    def _update_mode_ui(self, kind):
+        """Update a mode combobox to reflect current backend state"""
+        combobox, _ = self._mode_registry[kind]
+        cfg = self.model_manager.loaded_model_config
+        current_mode = cfg["model"].prompt_type
+        index = combobox.findData(current_mode)
         if index != -1:
-            self.gd_select_combobox.setCurrentIndex(index)
-
-    def update_florence2_mode_ui(self):
-        """Update Florence2 mode combobox to reflect current backend state"""
-        current_mode = self.model_manager.loaded_model_config[
-            "model"
-        ].prompt_type
-        index = self.florence2_select_combobox.findData(current_mode)
-        if index != -1:
-            self.florence2_select_combobox.setCurrentIndex(index)
-        self.update_florence2_widgets(current_mode)
+            combobox.setCurrentIndex(index)
+        if kind == "florence2":
+            self.update_florence2_widgets(current_mode)
 
     def on_output_modes_changed(self, output_modes, default_output_mode):
         """Handle output modes changed"""
-        # Disconnect onIndexChanged signal to prevent triggering
-        # on model select combobox change
-        self.output_select_combobox.currentIndexChanged.disconnect()
-
-        self.output_select_combobox.clear()
-        for output_mode, display_name in output_modes.items():
-            self.output_select_combobox.addItem(
-                display_name, userData=output_mode
+        # Block signals to prevent triggering on model select combobox change
+        with QSignalBlocker(self.output_select_combobox):
+            self.output_select_combobox.clear()
+            for output_mode, display_name in output_modes.items():
+                self.output_select_combobox.addItem(
+                    display_name, userData=output_mode
+                )
+            self.output_select_combobox.setCurrentIndex(
+                self.output_select_combobox.findData(default_output_mode)
             )
-        self.output_select_combobox.setCurrentIndex(
-            self.output_select_combobox.findData(default_output_mode)
-        )
 
-        # Reconnect onIndexChanged signal
-        self.output_select_combobox.currentIndexChanged.connect(
-            lambda: self.model_manager.set_output_mode(
-                self.output_select_combobox.currentData()
-            )
+    @pyqtSlot()
+    def on_output_mode_changed(self):
+        """Handle output mode combobox change"""
+        self.model_manager.set_output_mode(
+            self.output_select_combobox.currentData()
         )
 
     def update_visible_widgets(self, model_config):
@@ -657,55 +986,45 @@ class AutoLabelingWidget(QWidget):
         if not model_config or "model" not in model_config:
             return
         widgets = model_config["model"].get_required_widgets()
-        for widget_name in widgets:
-            if hasattr(self, widget_name):
-                getattr(self, widget_name).show()
-            else:
-                logger.warning(
-                    f"Warning: Widget '{widget_name}' not found in AutoLabelingWidget."
-                )
+        self.setUpdatesEnabled(False)
+        try:
+            for widget_name in widgets:
+                if hasattr(self, widget_name):
+                    getattr(self, widget_name).show()
+                else:
+                    logger.warning(
+                        f"Warning: Widget '{widget_name}' not found in AutoLabelingWidget."
+                    )
+        finally:
+            self.setUpdatesEnabled(True)
 
     def hide_labeling_widgets(self):
         """Hide labeling widgets by default"""
-        widgets = [
-            "button_run",
-            "button_add_point",
-            "button_remove_point",
-            "button_add_rect",
-            "button_clear",
-            "button_finish_object",
-            "button_preprocess_all",
-            "button_clear_cache",
-            "button_send",
-            "edit_text",
-            "edit_conf",
-            "edit_iou",
-            "input_box_thres",
-            "input_conf",
-            "input_iou",
-            "output_label",
-            "output_select_combobox",
-            "toggle_preserve_existing_annotations",
-            "button_set_api_token",
-            "button_reset_tracker",
-            "upn_select_combobox",
-            "gd_select_combobox",
-            "florence2_select_combobox",
-        ]
-        for widget in widgets:
-            getattr(self, widget).hide()
+        self.setUpdatesEnabled(False)
+        try:
+            for widget in self._LABELING_WIDGETS:
+                getattr(self, widget).hide()
+        finally:
+            self.setUpdatesEnabled(True)
 
     def on_new_marks(self, marks):
         """Handle new marks"""
         self.model_manager.set_auto_labeling_marks(marks)
         current_model_name = self.model_manager.loaded_model_config["type"]
-        if current_model_name not in _SKIP_PREDICTION_ON_NEW_MARKS_MODELS:
+        if current_model_name not in _SKIP_PREDICTION_ON_NEW_MARKS_MODELS_SET:
             self.run_prediction()
 
     def on_open(self):
         pass
 
     def on_close(self):
+        # 等待后台线程结束，避免销毁仍在运行的 QThread
+        if self.preprocess_thread is not None:
+            self.preprocess_canceled = True
+            self.preprocess_thread.requestInterruption()
+            self.preprocess_thread.wait()
+        if self.clear_cache_thread is not None:
+            self.clear_cache_thread.wait()
         return True
 
     def on_conf_value_changed(self, value):
@@ -744,135 +1063,67 @@ class AutoLabelingWidget(QWidget):
         self.model_manager.set_auto_labeling_prompt()
 
     @pyqtSlot()
-    def on_upn_mode_changed(self):
-        """Handle UPN mode change"""
-        mode = self.upn_select_combobox.currentData()
-        self.model_manager.set_upn_mode(mode)
-
-    @pyqtSlot()
-    def on_gd_mode_changed(self):
-        """Handle GroundingDino mode change"""
-        mode = self.gd_select_combobox.currentData()
-        self.model_manager.set_groundingdino_mode(mode)
-
-    @pyqtSlot()
-    def on_florence2_mode_changed(self):
-        """Handle Florence2 mode change"""
-        mode = self.florence2_select_combobox.currentData()
-        self.model_manager.set_florence2_mode(mode)
-        self.update_florence2_widgets(mode)
+    def on_finish_object(self):
+        """Handle finish object button"""
+        self.add_new_prompt()
+        self.finish_auto_labeling_object_action_requested.emit()
+        self.cache_auto_label_changed.emit()
+
+    def _on_mode_changed(self, kind, _index=None):
+        """Handle mode change of a mode combobox"""
+        # No model can be loaded before the model manager exists
+        if self._model_manager is None:
+            return
+        combobox, set_mode_name = self._mode_registry[kind]
+        mode = combobox.currentData()
+        getattr(self._model_manager, set_mode_name)(mode)
+        if kind == "florence2":
+            self.update_florence2_widgets(mode)
 
     def update_florence2_widgets(self, mode):
         """Update widget visibility based on Florence2 mode"""
         # Check if Florence2 model is loaded
-        if (
-            not self.model_manager.loaded_model_config
-            or self.model_manager.loaded_model_config.get("type")
-            != "florence2"
-        ):
+        cfg = self.model_manager.loaded_model_config
+        if not cfg or cfg.get("type") != "florence2":
             return
 
-        # Define which widgets are needed for each mode
-        mode_widgets = {
-            # Only need run button
-            "caption": ["button_run"],
-            "detailed_cap": ["button_run"],
-            "more_detailed_cap": ["button_run"],
-            "ocr": ["button_run"],
-            "ocr_with_region": ["button_run"],
-            "od": ["button_run"],
-            "region_proposal": ["button_run"],
-            "dense_region_cap": ["button_run"],
-            # Region-based modes need rectangle tools
-            "region_to_cat": [
-                "button_add_rect",
-                "button_clear",
-                "button_finish_object",
-            ],
-            "region_to_desc": [
-                "button_add_rect",
-                "button_clear",
-                "button_finish_object",
-            ],
-            "region_to_seg": [
-                "button_add_rect",
-                "button_clear",
-                "button_finish_object",
-            ],
-            # Other modes
-            "refer_exp_seg": ["edit_text", "button_send"],
-            "cap_to_pg": ["edit_text", "button_send"],
-            "ovd": ["edit_text", "button_send"],
-        }
-
-        # Define which modes should preserve existing annotations by default
-        preserve_annotations_modes = {
-            # Modes that should preserve existing annotations (replace=False)
-            "region_to_cat": "Replace (Off)",
-            "region_to_desc": "Replace (Off)",
-            "region_to_seg": "Replace (Off)",
-            "refer_exp_seg": "Replace (Off)",
-            # Modes that should replace existing annotations (replace=True)
-            "caption": "Replace (On)",
-            "detailed_cap": "Replace (On)",
-            "more_detailed_cap": "Replace (On)",
-            "od": "Replace (On)",
-            "region_proposal": "Replace (On)",
-            "dense_region_cap": "Replace (On)",
-            "ovd": "Replace (On)",
-            "cap_to_pg": "Replace (On)",
-            "ocr": "Replace (On)",
-            "ocr_with_region": "Replace (On)",
-        }
-
-        # Hide all widgets first
-        widgets_to_manage = [
-            "edit_text",
-            "button_run",
-            "button_send",
-            "button_add_rect",
-            "button_clear",
-            "button_finish_object",
-        ]
-
-        for widget_name in widgets_to_manage:
+        # Hide only the widgets the current mode does not use, so that
+        # widgets shown in both modes are not hidden and shown again
+        for widget_name in _FLORENCE2_HIDDEN_WIDGETS.get(
+            mode, _FLORENCE2_MANAGED_WIDGETS
+        ):
             getattr(self, widget_name).hide()
 
         if mode in ["ovd", "cap_to_pg", "refer_exp_seg"]:
             self.edit_text.setPlaceholderText("Enter prompt here...")
 
         # Show only the widgets needed for current mode
-        if mode in mode_widgets:
-            for widget_name in mode_widgets[mode]:
+        if mode in _FLORENCE2_MODE_WIDGETS:
+            for widget_name in _FLORENCE2_MODE_WIDGETS[mode]:
                 getattr(self, widget_name).show()
 
             # Show preserve annotations toggle for all modes
             self.toggle_preserve_existing_annotations.show()
             # Set the default state for preserve annotations
-            if mode in preserve_annotations_modes:
-                # Temporarily disconnect the signal to avoid triggering the callback
-                self.toggle_preserve_existing_annotations.toggled.disconnect()
-                # Set the state
-                self.toggle_preserve_existing_annotations.setText(
-                    preserve_annotations_modes[mode]
-                )
-                # Reconnect the signal
-                self.toggle_preserve_existing_annotations.toggled.connect(
-                    self.on_preserve_existing_annotations_state_changed
-                )
+            if mode in _FLORENCE2_PRESERVE_MODES:
+                state = _FLORENCE2_PRESERVE_MODES[mode]
+                # Block signals to avoid triggering the callback
+                with QSignalBlocker(self.toggle_preserve_existing_annotations):
+                    self.toggle_preserve_existing_annotations.setText(state)
                 # Manually trigger the state change to update the model
-                self.on_preserve_existing_annotations_state_changed(
-                    preserve_annotations_modes[mode]
-                )
+                self.on_preserve_existing_annotations_state_changed(state)
 
     def preprocess_all_images(self):
         """预处理所有图像，生成并缓存编码结果"""
-        from PyQt5.QtWidgets import QProgressDialog, QMessageBox
-        from PyQt5.QtCore import Qt, QTimer
-        import os.path as osp
-        
+        # 上一次预处理仍在收尾时不重复启动
+        if (
+            self.preprocess_thread is not None
+            and self.preprocess_thread.isRunning()
+        ):
+            return
+
         # 检查是否有图像列表
-        if not hasattr(self.parent, 'image_list') or not self.parent.image_list:
+        if not hasattr(self._parent, 'image_list') or not self._parent.image_list:
             QMessageBox.warning(
                 self, 
                 self.tr("警告"), 
@@ -905,166 +1156,119 @@ class AutoLabelingWidget(QWidget):
         if reply != QMessageBox.Yes:
             return
         
-        # 创建进度对话框
-        image_list = self.parent.image_list
-        self.preprocess_progress = QProgressDialog(
-            self.tr("正在预处理图像..."), 
-            self.tr("取消"), 
-            0, 
-            len(image_list), 
-            self
+        # 先跳过已有缓存的图像，只为剩余图像排队编码
+        image_list = self._parent.image_list
+        model = self.model_manager.loaded_model_config["model"]
+        if get_image_encoder(model) is None:
+            logger.warning(f"Unsupported model for preprocessing: {model}")
+            QMessageBox.warning(
+                self, self.tr("警告"), self.tr("请先加载支持的SAM模型！")
+            )
+            return
+        find = model.image_embedding_cache.find
+        todo = [filename for filename in image_list if not find(filename)]
+        logger.info(
+            f"Preprocess: {len(image_list) - len(todo)} cached, "
+            f"{len(todo)} to encode"
         )
-        self.preprocess_progress.setWindowModality(Qt.WindowModal)
-        self.preprocess_progress.setWindowTitle(self.tr("预处理进度"))
-        self.preprocess_progress.setMinimumWidth(400)
-        self.preprocess_progress.setMinimumHeight(150)
-        
-        # 设置样式
-        self.preprocess_progress.setStyleSheet("""
-        QProgressDialog {
-            background-color: rgba(255, 255, 255, 0.95);
-            border-radius: 12px;
-            min-width: 280px;
-            min-height: 120px;
-            padding: 20px;
-        }
-        QProgressBar {
-            border: none;
-            border-radius: 4px;
-            background-color: rgba(0, 0, 0, 0.05);
-            text-align: center;
-            color: #1d1d1f;
-            font-size: 13px;
-            min-height: 20px;
-            max-height: 20px;
-            margin: 16px 0;
-        }
-        QProgressBar::chunk {
-            background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                stop:0 #0066FF,
-                stop:0.5 #00A6FF,
-                stop:1 #0066FF);
-            border-radius: 3px;
-        }
-        QLabel {
-            color: #1d1d1f;
-            font-size: 13px;
-            font-weight: 500;
-            margin-bottom: 8px;
-        }
-        QPushButton {
-            background-color: rgba(255, 255, 255, 0.8);
-            border: 0.5px solid rgba(0, 0, 0, 0.1);
-            border-radius: 6px;
-            font-weight: 500;
-            font-size: 13px;
-            color: #0066FF;
-            min-width: 82px;
-            height: 36px;
-            padding: 0 16px;
-            margin-top: 16px;
-        }
-        QPushButton:hover {
-            background-color: rgba(0, 0, 0, 0.05);
-        }
-        """)
-        
-        # 初始化处理变量
-        self.preprocess_index = 0
-        self.preprocess_cancel = False
-        
-        # 连接取消信号
-        self.preprocess_progress.canceled.connect(self.cancel_preprocess)
-        
+        self.preprocess_total = len(image_list)
+        if not todo:
+            self.show_preprocess_finished()
+            return
+
+        # 进度对话框只创建一次，之后复用
+        progress = self.get_preprocess_progress()
+        progress.reset()
+        progress.setLabelText(self.tr("正在预处理图像..."))
+        progress.setMaximum(len(todo))
+        self.preprocess_basenames = [os.path.basename(p) for p in todo]
+        self.preprocess_label_format = self.tr("正在处理: {} ({}/{})")
+        self.preprocess_progress_time = 0.0
+
+        # 在后台线程中编码图像，避免阻塞界面
+        self.preprocess_canceled = False
+        self.preprocess_thread = PreprocessThread(model, todo, self)
+        self.preprocess_thread.progress.connect(self.on_preprocess_progress)
+        self.preprocess_thread.completed.connect(self.on_preprocess_completed)
+
         # 显示进度对话框
-        self.preprocess_progress.show()
-        
-        # 开始处理第一张图像
-        QTimer.singleShot(100, self.process_next_image)
-    
+        progress.show()
+        self.preprocess_thread.start()
+
+    def get_preprocess_progress(self):
+        """创建预处理进度对话框，只在首次调用时创建"""
+        if self.preprocess_progress is None:
+            progress = QProgressDialog(
+                self.tr("正在预处理图像..."), self.tr("取消"), 0, 0, self
+            )
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setWindowTitle(self.tr("预处理进度"))
+            progress.setMinimumWidth(400)
+            progress.setMinimumHeight(150)
+            progress.setStyleSheet(_PREPROCESS_DIALOG_QSS)
+            # 自行持有进度条并直接更新，模态对话框的 setValue 每次都会
+            # 嵌套处理一轮事件
+            self.preprocess_progress_bar = QProgressBar(progress)
+            progress.setBar(self.preprocess_progress_bar)
+            # 连接取消信号
+            progress.canceled.connect(self.cancel_preprocess)
+            self.preprocess_progress = progress
+        return self.preprocess_progress
+
     def cancel_preprocess(self):
         """取消预处理"""
-        self.preprocess_cancel = True
-        
-    def process_next_image(self):
-        """处理下一张图像"""
-        from anylabeling.views.labeling.utils.opencv import qt_img_to_rgb_cv_img
-        from PyQt5.QtWidgets import QMessageBox
-        from PyQt5.QtCore import QTimer
-        import os.path as osp
-        
-        if self.preprocess_cancel:
-            self.preprocess_progress.close()
-            return
-            
-        image_list = self.parent.image_list
-        
-        if self.preprocess_index >= len(image_list):
-            # 处理完成
-            self.preprocess_progress.close()
-            QMessageBox.information(
-                self,
-                self.tr("完成"),
-                self.tr("预处理完成！已为 {} 张图像生成编码缓存。").format(len(image_list))
-            )
+        self.preprocess_canceled = True
+        self.preprocess_thread.requestInterruption()
+
+    def on_preprocess_progress(self, index, filename):
+        """更新预处理进度"""
+        total = len(self.preprocess_basenames)
+        now = time.monotonic()
+        if (
+            index % self._PREPROCESS_PROGRESS_STEP
+            and index + 1 < total
+            and now - self.preprocess_progress_time
+            < self._PREPROCESS_PROGRESS_INTERVAL
+        ):
             return
-        
-        # 获取当前图像
-        current_file = image_list[self.preprocess_index]
+        self.preprocess_progress_time = now
         self.preprocess_progress.setLabelText(
-            self.tr("正在处理: {} ({}/{})").format(
-                osp.basename(current_file), 
-                self.preprocess_index + 1, 
-                len(image_list)
+            self.preprocess_label_format.format(
+                self.preprocess_basenames[index], index + 1, total
             )
         )
-        self.preprocess_progress.setValue(self.preprocess_index)
-        
-        try:
-            # 检查是否已经缓存
-            model = self.model_manager.loaded_model_config.get("model")
-            if model and hasattr(model, 'image_embedding_cache'):
-                if not model.image_embedding_cache.find(current_file):
-                    print(f"[预处理] 开始处理: {current_file}")
-                    # 加载图像并生成编码
-                    image = model.load_image_from_filename(current_file)
-                    if image is not None:
-                        cv_image = qt_img_to_rgb_cv_img(image)
-                        # 生成编码
-                        if hasattr(model, 'model') and hasattr(model.model, 'encode'):
-                            image_embedding = model.model.encode(cv_image)
-                        elif hasattr(model, 'encoder_model'):
-                            image_embedding = model.encoder_model(cv_image)
-                        else:
-                            # 跳过不支持的模型
-                            print(f"[预处理] 跳过不支持的模型: {type(model)}")
-                            pass
-                        
-                        # 保存到缓存
-                        if 'image_embedding' in locals():
-                            model.image_embedding_cache.put(current_file, image_embedding)
-                            print(f"[预处理] 编码已缓存: {current_file}")
-                        else:
-                            print(f"[预处理] 编码生成失败: {current_file}")
-                else:
-                    print(f"[预处理] 已存在缓存，跳过: {current_file}")
-        
-        except Exception as e:
-            # 忽略单个图像的错误，继续处理下一张
-            print(f"处理图像 {current_file} 时出错: {e}")
-        
-        # 处理下一张图像
-        self.preprocess_index += 1
-        QTimer.singleShot(50, self.process_next_image)
+        self.preprocess_progress_bar.setValue(index)
+
+    def on_preprocess_completed(self, encoded):
+        """预处理结束"""
+        # close() 会触发 canceled 信号，这里不能当作用户取消
+        with QSignalBlocker(self.preprocess_progress):
+            self.preprocess_progress.close()
+        if self.preprocess_canceled:
+            return
+        self.show_preprocess_finished()
+
+    def show_preprocess_finished(self):
+        """提示预处理完成"""
+        QMessageBox.information(
+            self,
+            self.tr("完成"),
+            self.tr("预处理完成！已为 {} 张图像生成编码缓存。").format(
+                self.preprocess_total
+            ),
+        )
 
     def clear_cache(self):
         """清理缓存目录"""
-        from PyQt5.QtWidgets import QMessageBox
-        import shutil
-        import os
-        
-        cache_dir = "/tmp/xanylabeling_cache"
-        
+        # 已加载模型的缓存仍在使用中，需通过它清理以同步其索引和内存缓存
+        cfg = self.loaded_model_config
+        model = cfg.get("model") if cfg else None
+        cache = getattr(model, "image_embedding_cache", None)
+        if cache is not None:
+            cache_dir = str(cache.cache_dir)
+        else:
+            cache_dir = get_default_cache_dir()
+
         # 确认对话框
         reply = QMessageBox.question(
             self,
@@ -1077,24 +1281,33 @@ class AutoLabelingWidget(QWidget):
         if reply != QMessageBox.Yes:
             return
         
-        try:
-            if os.path.exists(cache_dir):
-                # 删除整个目录
-                shutil.rmtree(cache_dir)
-                QMessageBox.information(
-                    self,
-                    self.tr("成功"),
-                    self.tr("缓存目录已清理完成！")
-                )
-            else:
-                QMessageBox.information(
-                    self,
-                    self.tr("提示"),
-                    self.tr("缓存目录不存在，无需清理。")
-                )
-        except Exception as e:
+        if not os.path.exists(cache_dir):
+            QMessageBox.information(
+                self,
+                self.tr("提示"),
+                self.tr("缓存目录不存在，无需清理。")
+            )
+            return
+
+        # 在后台线程中清理，避免阻塞界面
+        self.button_clear_cache.setEnabled(False)
+        self.clear_cache_thread = ClearCacheThread(cache_dir, cache, self)
+        self.clear_cache_thread.completed.connect(
+            self.on_clear_cache_completed
+        )
+        self.clear_cache_thread.start()
+
+    @pyqtSlot(str)
+    def on_clear_cache_completed(self, error):
+        """缓存清理结束"""
+        self.button_clear_cache.setEnabled(True)
+        if error:
             QMessageBox.critical(
                 self,
                 self.tr("错误"),
-                self.tr("清理缓存时发生错误：{}").format(str(e))
+                self.tr("清理缓存时发生错误：{}").format(error),
+            )
+        else:
+            QMessageBox.information(
+                self, self.tr("成功"), self.tr("缓存目录已清理完成！")
             )
@@ -0,0 +1,154 @@
+import os
+import shutil
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from anylabeling.views.labeling.logger import logger
+from anylabeling.views.labeling.utils.opencv import qt_img_to_rgb_cv_img
+
+
+def get_image_encoder(model):
+    """Return the image encoder callable of a SAM-like model or None"""
+    encoder = getattr(getattr(model, "model", None), "encode", None)
+    if encoder is None:
+        encoder = getattr(model, "encoder_model", None)
+    return encoder
+
+
+class PreprocessThread(QThread):
+    """Encode images with a SAM-like model and cache the embeddings
+
+    image_list should only hold images without a cached embedding.
+    Images are read and decoded by a pool of loader threads while this
+    thread runs the encoder, so disk I/O overlaps with inference.
+    """
+
+    # Number of loader threads and of decoded images waiting for the
+    # encoder, which bounds the memory held by the pipeline
+    LOADER_WORKERS = min(8, os.cpu_count() or 1)
+    PREFETCH_SIZE = 8
+
+    # index of the image being processed, image path
+    progress = pyqtSignal(int, str)
+    # number of images that were encoded
+    completed = pyqtSignal(int)
+
+    def __init__(self, model, image_list, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.encoder = get_image_encoder(model)
+        self.cache = model.image_embedding_cache
+        self.image_list = image_list
+
+    def run(self):
+        encoded = 0
+        files = enumerate(self.image_list)
+        pending = collections.deque()
+        with ThreadPoolExecutor(
+            max_workers=self.LOADER_WORKERS,
+            thread_name_prefix="preprocess-loader",
+        ) as executor:
+
+            def submit_next():
+                item = next(files, None)
+                if item is not None:
+                    index, filename = item
+                    future = executor.submit(self.load_image, filename)
+                    pending.append((index, filename, future))
+
+            for _ in range(self.PREFETCH_SIZE):
+                submit_next()
+
+            while pending:
+                if self.isInterruptionRequested():
+                    for _, _, future in pending:
+                        future.cancel()
+                    break
+                index, filename, future = pending.popleft()
+                submit_next()
+                self.progress.emit(index, filename)
+                try:
+                    loaded = future.result()
+                    if loaded is not None and self.encode_image(
+                        filename, loaded[1]
+                    ):
+                        encoded += 1
+                except Exception as e:
+                    # Skip the failing image and keep going
+                    logger.warning(f"Failed to preprocess {filename}: {e}")
+        self.completed.emit(encoded)
+
+    def load_image(self, filename):
+        """Load an image for encoding, runs on a loader thread
+
+        Returns (image, cv_image) or None if there is nothing to encode.
+        The QImage is returned as well since cv_image may be a view on it.
+        """
+        if self.isInterruptionRequested():
+            return None
+        image = self.model.load_image_from_filename(filename)
+        if image is None:
+            return None
+        return image, qt_img_to_rgb_cv_img(image)
+
+    def encode_image(self, filename, cv_image):
+        """Encode one image and cache it, returns True on success"""
+        image_embedding = self.encoder(cv_image)
+        if image_embedding is None:
+            return False
+        self.cache.put(filename, image_embedding)
+        return True
+
+
+class ClearCacheThread(QThread):
+    """Clear an embedding cache
+
+    A cache that is in use is cleared through its clear() method, which
+    also resets its index and the values it holds in memory. Otherwise the
+    cache directory is deleted, unlinking its entries in parallel.
+    """
+
+    DELETE_WORKERS = 8
+
+    # error message, empty on success
+    completed = pyqtSignal(str)
+
+    def __init__(self, cache_dir, cache=None, parent=None):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.cache = cache
+
+    def run(self):
+        try:
+            if self.cache is not None:
+                self.cache.clear()
+            else:
+                self.remove_cache_dir()
+        except Exception as e:
+            logger.error(f"Failed to clear cache {self.cache_dir}: {e}")
+            self.completed.emit(str(e))
+            return
+        self.completed.emit("")
+
+    def remove_cache_dir(self):
+        with os.scandir(self.cache_dir) as entries:
+            with ThreadPoolExecutor(
+                max_workers=self.DELETE_WORKERS,
+                thread_name_prefix="clear-cache",
+            ) as executor:
+                futures = [
+                    executor.submit(self.remove_entry, entry)
+                    for entry in entries
+                ]
+                for future in futures:
+                    future.result()
+        os.rmdir(self.cache_dir)
+
+    @staticmethod
+    def remove_entry(entry):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
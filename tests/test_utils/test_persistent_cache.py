@@ -0,0 +1,397 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from anylabeling.services.auto_labeling import persistent_cache
+from anylabeling.services.auto_labeling.persistent_cache import (
+    PersistentCache,
+    get_default_cache_dir,
+)
+
+
+def make_embedding(seed):
+    return {
+        "image_embedding": np.full((1, 16, 8, 8), seed, dtype=np.float32),
+        "original_size": (480, 640),
+    }
+
+
+class TestPersistentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.temp_dir.name
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        self.temp_dir.cleanup()
+
+    def open_cache(self, **kwargs):
+        kwargs.setdefault("compression_level", None)
+        kwargs.setdefault("memory_items", 0)
+        cache = PersistentCache(self.cache_dir, **kwargs)
+        self.caches.append(cache)
+        return cache
+
+    def assert_embedding_equal(self, value, expected):
+        self.assertEqual(value["original_size"], expected["original_size"])
+        self.assertEqual(value["image_embedding"].dtype, np.float32)
+        np.testing.assert_array_equal(
+            value["image_embedding"], expected["image_embedding"]
+        )
+
+    def test_identical_values_are_hard_linked(self):
+        cache = self.open_cache()
+        expected = make_embedding(1)
+        cache.put("a.jpg", expected)
+        file_size = cache.get_cache_info()["size_mb"]
+        cache.put("b.jpg", expected)
+        cache.put("b.jpg", expected)
+
+        stat_a = os.stat(cache._get_cache_path("a.jpg"))
+        stat_b = os.stat(cache._get_cache_path("b.jpg"))
+        self.assertEqual(stat_a.st_ino, stat_b.st_ino)
+        self.assertFalse(
+            [name for name in os.listdir(self.cache_dir) if ".tmp" in name]
+        )
+        self.assert_embedding_equal(cache.get("b.jpg"), expected)
+
+        # The shared file counts toward the cache size once
+        info = cache.get_cache_info()
+        self.assertEqual(info["files"], 2)
+        self.assertEqual(info["size_mb"], file_size)
+
+        cache.put("a.jpg", make_embedding(2))
+        self.assertEqual(cache.get_cache_info()["size_mb"], 2 * file_size)
+        self.assert_embedding_equal(cache.get("b.jpg"), expected)
+
+    def test_shared_file_size_released_with_last_name(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        cache.put("b.jpg", make_embedding(1))
+        os.remove(cache._get_cache_path("a.jpg"))
+        self.assertIsNone(cache.get("a.jpg"))
+        self.assertGreater(cache.get_cache_info()["size_mb"], 0)
+
+        os.remove(cache._get_cache_path("b.jpg"))
+        self.assertIsNone(cache.get("b.jpg"))
+        self.assertEqual(cache.get_cache_info()["size_mb"], 0)
+
+    def test_unhashable_key(self):
+        cache = self.open_cache()
+        key = ["a.jpg", 0]
+        cache.put(key, make_embedding(1))
+        self.assertTrue(cache.find(key))
+        self.assert_embedding_equal(cache.get(key), make_embedding(1))
+        self.assertEqual(
+            cache._get_cache_key(key), cache._get_cache_key(str(key))
+        )
+
+    def test_clear(self):
+        cache = self.open_cache(memory_items=4)
+        cache.put("a.jpg", make_embedding(1))
+        cache.put("b.jpg", make_embedding(2))
+        # Files the index does not know about
+        for name in ("embedding_other.pkl", "embedding_crashed.tmp"):
+            with open(os.path.join(self.cache_dir, name), "wb") as f:
+                f.write(b"stale")
+        cache.clear()
+        self.assertFalse(cache.find("a.jpg"))
+        self.assertIsNone(cache.get("b.jpg"))
+        self.assertEqual(cache.get_cache_info()["files"], 0)
+        self.assertEqual(os.listdir(self.cache_dir), ["metadata.log"])
+
+        cache.put("a.jpg", make_embedding(3))
+        self.assert_embedding_equal(cache.get("a.jpg"), make_embedding(3))
+
+    def test_reload_from_journal(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        cache.put("b.jpg", make_embedding(2))
+        cache.close()
+
+        reloaded = self.open_cache()
+        self.assertEqual(list(reloaded.metadata), list(cache.metadata))
+        self.assertEqual(
+            reloaded.get_cache_info()["files"],
+            cache.get_cache_info()["files"],
+        )
+        self.assert_embedding_equal(reloaded.get("b.jpg"), make_embedding(2))
+
+    def test_reload_skips_malformed_journal_lines(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        cache.close()
+        with open(cache.metadata_file, "ab") as f:
+            f.write(b"embedding_x.pkl\tnot-a-size\t0\n")
+
+        reloaded = self.open_cache()
+        self.assertTrue(reloaded.find("a.jpg"))
+
+    def test_journal_compaction(self):
+        cache = self.open_cache()
+        cache.JOURNAL_COMPACT_MIN_LINES = 4
+        cache.put("a.jpg", make_embedding(1))
+        for _ in range(10):
+            cache.get("a.jpg")
+        cache.put("b.jpg", make_embedding(2))
+        cache.close()
+
+        with open(cache.metadata_file, "rb") as f:
+            self.assertEqual(len(f.readlines()), 2)
+        reloaded = self.open_cache()
+        self.assertEqual(list(reloaded.metadata), list(cache.metadata))
+
+    def test_concurrent_put_and_get(self):
+        cache = self.open_cache(memory_items=4)
+        keys = [f"{index}.jpg" for index in range(64)]
+        errors = []
+
+        def worker(offset):
+            try:
+                for step in range(len(keys)):
+                    index = (offset + step) % len(keys)
+                    cache.put(keys[index], make_embedding(index))
+                    value = cache.get(keys[(index + 1) % len(keys)])
+                    if value is not None:
+                        seed = value["image_embedding"].flat[0]
+                        self.assertEqual(
+                            keys[int(seed)], keys[(index + 1) % len(keys)]
+                        )
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=worker, args=(offset * 8,))
+            for offset in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get_cache_info()["files"], len(keys))
+        total_size = sum(
+            os.path.getsize(cache._get_cache_path(key)) for key in keys
+        )
+        self.assertEqual(
+            cache.get_cache_info()["size_mb"], total_size / 1024**2
+        )
+        for index, key in enumerate(keys):
+            self.assert_embedding_equal(cache.get(key), make_embedding(index))
+
+    def test_missing_key(self):
+        cache = self.open_cache()
+        self.assertFalse(cache.find("missing.jpg"))
+        self.assertIsNone(cache.get("missing.jpg"))
+
+    def test_round_trip_uncompressed(self):
+        cache = self.open_cache()
+        expected = make_embedding(1.5)
+        cache.put("a.jpg", expected)
+        self.assertTrue(cache.find("a.jpg"))
+        self.assert_embedding_equal(cache.get("a.jpg"), expected)
+
+    def test_corrupt_file(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        with open(cache._get_cache_path("a.jpg"), "wb") as f:
+            f.write(b"not a cache file")
+        self.assertIsNone(cache.get("a.jpg"))
+        self.assertFalse(cache.find("a.jpg"))
+
+    def test_truncated_file(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        path = cache._get_cache_path("a.jpg")
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // 2)
+        self.assertIsNone(cache.get("a.jpg"))
+        self.assertFalse(cache.find("a.jpg"))
+
+    @unittest.skipIf(
+        persistent_cache.zstandard is None, "zstandard is not installed"
+    )
+    def test_round_trip_compressed(self):
+        cache = self.open_cache(compression_level=3)
+        expected = make_embedding(2.5)
+        cache.put("a.jpg", expected)
+        self.assert_embedding_equal(cache.get("a.jpg"), expected)
+
+    def test_memory_mapped_values_are_private(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        value = cache.get("a.jpg")
+        value["image_embedding"][...] = 5
+        self.assert_embedding_equal(cache.get("a.jpg"), make_embedding(1))
+
+    def test_round_trip_without_mmap(self):
+        cache = self.open_cache()
+        with mock.patch.object(persistent_cache, "_USE_MMAP", False):
+            cache.put("a.jpg", make_embedding(1))
+            value = cache.get("a.jpg")
+            self.assert_embedding_equal(value, make_embedding(1))
+            # Nothing keeps the file open, so it can be replaced
+            cache.put("a.jpg", make_embedding(2))
+            self.assert_embedding_equal(cache.get("a.jpg"), make_embedding(2))
+
+    def test_memory_layer(self):
+        cache = self.open_cache(memory_items=2)
+        for seed, key in enumerate(("a.jpg", "b.jpg", "c.jpg"), start=1):
+            cache.put(key, make_embedding(seed))
+        cache.get("b.jpg")
+        cache.put("d.jpg", make_embedding(4))
+        for key in ("a.jpg", "b.jpg", "c.jpg", "d.jpg"):
+            os.remove(cache._get_cache_path(key))
+
+        # Only the two most recently used values are kept in memory
+        self.assertIsNone(cache.get("a.jpg"))
+        self.assertIsNone(cache.get("c.jpg"))
+        self.assert_embedding_equal(cache.get("b.jpg"), make_embedding(2))
+        self.assert_embedding_equal(cache.get("d.jpg"), make_embedding(4))
+        self.assertEqual(len(cache._mem), 2)
+
+    def fill_for_eviction(self, eviction):
+        """Put a, b, c, read a, then put d into a cache holding 3.5 files.
+
+        Eviction runs until the cache is at 80% of its limit, so adding d
+        evicts two of a, b and c.
+        """
+        probe = self.open_cache()
+        probe.put("probe", make_embedding(0))
+        file_size = probe.metadata[probe._get_cache_key("probe")][0]
+        probe.clear()
+
+        cache = self.open_cache(
+            eviction=eviction, max_size_gb=3.5 * file_size / 1024**3
+        )
+        for seed, key in enumerate("abc", start=1):
+            cache.put(key, make_embedding(seed))
+        cache.get("a")
+        cache.put("d", make_embedding(4))
+        return {key for key in "abcd" if cache.find(key)}
+
+    def test_lru_eviction(self):
+        self.assertEqual(self.fill_for_eviction("lru"), {"a", "d"})
+
+    def test_mru_eviction(self):
+        self.assertEqual(self.fill_for_eviction("mru"), {"b", "d"})
+
+    def test_fifo_eviction(self):
+        self.assertEqual(self.fill_for_eviction("fifo"), {"c", "d"})
+
+    def test_unknown_eviction_policy(self):
+        with self.assertRaises(ValueError):
+            PersistentCache(self.cache_dir, eviction="random")
+
+    def test_best_effort_writes(self):
+        cache = self.open_cache(durable=False)
+        cache.put("a.jpg", make_embedding(1))
+        old_value = cache.get("a.jpg")
+        cache.put("a.jpg", make_embedding(2))
+
+        self.assert_embedding_equal(cache.get("a.jpg"), make_embedding(2))
+        # A value read before the overwrite is left untouched
+        self.assert_embedding_equal(old_value, make_embedding(1))
+        self.assertFalse(
+            [name for name in os.listdir(self.cache_dir) if ".tmp" in name]
+        )
+        self.assertEqual(cache.get_cache_info()["files"], 1)
+
+    def test_reload_from_directory_scan(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        cache.close()
+        os.remove(cache.metadata_file)
+
+        reloaded = self.open_cache()
+        self.assertTrue(reloaded.find("a.jpg"))
+        self.assert_embedding_equal(reloaded.get("a.jpg"), make_embedding(1))
+
+    def test_reload_drops_files_removed_behind_the_journal(self):
+        cache = self.open_cache()
+        cache.put("a.jpg", make_embedding(1))
+        cache.put("b.jpg", make_embedding(2))
+        cache.close()
+        os.remove(cache._get_cache_path("a.jpg"))
+
+        reloaded = self.open_cache()
+        self.assertFalse(reloaded.find("a.jpg"))
+        self.assertTrue(reloaded.find("b.jpg"))
+        self.assertEqual(reloaded.get_cache_info()["files"], 1)
+
+    def test_round_trip_half_precision(self):
+        full = self.open_cache()
+        full.put("a.jpg", make_embedding(0.1))
+        full_size = full.get_cache_info()["size_mb"]
+        full.clear()
+
+        cache = self.open_cache(half_precision=True)
+        expected = make_embedding(0.1)
+        expected["too_large"] = np.array([1e6], dtype=np.float32)
+        cache.put("a.jpg", expected)
+        value = cache.get("a.jpg")
+        self.assertEqual(value["image_embedding"].dtype, np.float32)
+        np.testing.assert_allclose(
+            value["image_embedding"],
+            expected["image_embedding"],
+            rtol=1e-3,
+        )
+        # Values beyond the float16 range are kept at full precision
+        np.testing.assert_array_equal(
+            value["too_large"], expected["too_large"]
+        )
+        self.assertLess(cache.get_cache_info()["size_mb"], full_size)
+
+
+class TestDefaultCacheDir(unittest.TestCase):
+
+    def test_environment_variable(self):
+        with mock.patch.dict(
+            os.environ,
+            {"XANYLABELING_CACHE_DIR": "/data/cache", "XDG_CACHE_HOME": "/x"},
+        ):
+            self.assertEqual(get_default_cache_dir(), "/data/cache")
+
+    @mock.patch.object(os, "name", "posix")
+    def test_xdg_cache_home(self):
+        with mock.patch.dict(
+            os.environ, {"XDG_CACHE_HOME": "/xdg"}, clear=True
+        ):
+            self.assertEqual(
+                get_default_cache_dir(),
+                os.path.join("/xdg", "xanylabeling_cache"),
+            )
+
+    @mock.patch.object(os, "name", "posix")
+    def test_home_cache(self):
+        with mock.patch.dict(os.environ, {"HOME": "/home/user"}, clear=True):
+            self.assertEqual(
+                get_default_cache_dir(),
+                os.path.join(
+                    os.path.expanduser("~"), ".cache", "xanylabeling_cache"
+                ),
+            )
+
+    @mock.patch.object(os, "name", "nt")
+    def test_local_app_data(self):
+        with mock.patch.dict(
+            os.environ,
+            {"LOCALAPPDATA": "/appdata", "XDG_CACHE_HOME": "/xdg"},
+            clear=True,
+        ):
+            self.assertEqual(
+                get_default_cache_dir(),
+                os.path.join("/appdata", "xanylabeling_cache"),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()